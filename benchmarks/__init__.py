@@ -0,0 +1,3 @@
+"""
+Benchmarks of knowledge-clustering, run with `python -m benchmarks.run`.
+"""
@@ -0,0 +1,126 @@
+"""
+Synthetic corpora for the benchmarks, generated from the corpus of examples/phd.
+
+A corpus at scale k contains k copies of every knowledge of the original corpus:
+the first one is the knowledge itself, and the others are obtained by adding a
+made-up word in front of it.
+"""
+
+from __future__ import annotations  # Support of `|` for type union in Python 3.9
+
+from pathlib import Path
+from typing import NamedTuple
+
+import itertools
+import random
+
+from knowledge_clustering import cst
+from knowledge_clustering.diagnose import parse as parse_diagnose
+
+PHD_DIR: Path = Path(__file__).parent.parent / "examples" / "phd"
+NB_KNOWN_BAGS: int = 700  # Bags of the phd corpus given as known to the cluster command
+SYLLABLES: list[str] = ["ka", "lo", "mi", "nu", "ré", "sa", "to", "vi", "xe", "zu"]
+FILLER_WORDS: list[str] = (
+    "we show that the of a an is are for every there exists such and or in by "
+    + "with this which let be then if only"
+).split()
+
+
+class Corpus(NamedTuple):
+    """Synthetic corpus."""
+
+    bags: list[list[str]]  # Known knowledges
+    unknown: list[str]  # Knowledges of the diagnose file
+
+
+def variant_words(scale: int) -> list[str]:
+    """Returns `scale - 1` distinct made-up words."""
+    words = (
+        "".join(syllables)
+        for n in itertools.count(2)
+        for syllables in itertools.product(SYLLABLES, repeat=n)
+    )
+    return list(itertools.islice(words, scale - 1))
+
+
+def variants(kl: str, words: list[str]) -> list[str]:
+    """Returns the knowledge together with its variants obtained by adding a word."""
+    return [kl] + [f"{w} {kl}" for w in words]
+
+
+def phd_bags() -> list[list[str]]:
+    """Returns the bags of the knowledge file of the phd corpus."""
+    bags: list[list[str]] = []
+    with open(PHD_DIR / "default.kl", encoding="utf-8") as f:
+        for line in f:
+            line = line.lstrip("%").strip()
+            if line.startswith("\\knowledge{"):
+                bags.append([])
+            elif line.startswith("|") and bags:
+                bags[-1].append(line[1:].strip())
+    return [bag for bag in bags if bag]
+
+
+def corpus(scale: int) -> Corpus:
+    """Returns the corpus at some scale."""
+    words = variant_words(scale)
+    bags = [
+        [f"{w} {kl}".strip() for kl in bag]
+        for w in [""] + words
+        for bag in phd_bags()[:NB_KNOWN_BAGS]
+    ]
+    unknown = [
+        v
+        for kl in parse_diagnose(str(PHD_DIR / "thesis-morvan.diagnose"))
+        for v in variants(kl, words)
+    ]
+    return Corpus(bags, unknown)
+
+
+def knowledge_file(bags: list[list[str]]) -> str:
+    """Returns the content of a knowledge file defining some bags."""
+    return "".join(
+        "\\knowledge{notion}\n" + "".join(f" | {kl}\n" for kl in bag) + "\n"
+        for bag in bags
+    )
+
+
+def diagnose_file(unknown: list[str]) -> str:
+    """Returns the content of a diagnose file containing some undefined knowledges."""
+    return (
+        f"{cst.SEPARATION_HEADING_KL_BLOCK}\n* Undefined knowledges *\n"
+        + f"{cst.SEPARATION_HEADING_KL_BLOCK}\n\n\\knowledge{{ignore}}\n"
+        + "".join(f" | {kl}\n" for kl in unknown)
+    )
+
+
+def tex_file(bags: list[list[str]], scale: int, seed: int = 0) -> str:
+    """
+    Returns a TeX document of about 300 KB times `scale` using some knowledges,
+    that are either quoted, introduced (preceded or not by an anchor point),
+    or used without quotes.
+    """
+    rng = random.Random(seed)
+    knowledges = [kl for bag in bags for kl in bag]
+    paragraphs: list[str] = []
+    for _ in range(600 * scale):
+        words: list[str] = []
+        for _ in range(rng.randint(40, 120)):
+            r = rng.random()
+            if r < 0.08:
+                words.append(f'"{rng.choice(knowledges)}"')
+            elif r < 0.1:
+                words.append(rng.choice(knowledges))
+            elif r < 0.11:
+                anchor = "\\AP " if rng.random() < 0.7 else ""
+                words.append(f'{anchor}""{rng.choice(knowledges)}""')
+            elif r < 0.12:
+                words.append(f"${rng.choice(SYLLABLES)}_{rng.randint(0, 9)}$")
+            elif r < 0.13:
+                words.append(f"% {rng.choice(FILLER_WORDS)}\n")
+            else:
+                words.append(rng.choice(FILLER_WORDS))
+            if rng.random() < 0.1:
+                words.append("\n")
+        paragraphs.append(" ".join(words))
+    return "\n\n".join(paragraphs) + "\n"
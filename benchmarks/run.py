@@ -0,0 +1,291 @@
+"""
+Benchmarks of the commands of knowledge-clustering on synthetic corpora.
+
+Every benchmark is run at some scale in a fresh Python process, so that caches and
+imported modules of a benchmark do not affect the others. Wall time is the best of
+several runs, and peak memory is measured with tracemalloc in a separate run.
+
+Usage:
+    python -m benchmarks.run                    # Runs all benchmarks at scale 1
+    python -m benchmarks.run -s 100 -b anchor   # Runs one benchmark at scale 100
+    python -m benchmarks.run --save             # Stores the results as the baseline
+    python -m benchmarks.run --compare          # Compares the results to the baseline
+"""
+
+from __future__ import annotations  # Support of `|` for type union in Python 3.9
+
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import click
+
+from benchmarks import corpus
+
+BASELINE_FILE: Path = Path(__file__).parent / "baseline.json"
+DEFAULT_SCALES: list[int] = [1]
+REGRESSION_THRESHOLD: float = 1.25  # Maximal ratio between a time and its baseline
+
+
+class Result(NamedTuple):
+    """Result of a benchmark at some scale."""
+
+    time: float  # In seconds
+    memory: int  # Peak memory in bytes, as measured by tracemalloc
+
+
+class Answers:
+    """Input stream answering yes to every question."""
+
+    def readline(self) -> str:
+        """Returns a positive answer."""
+        return "y\n"
+
+
+def write(directory: str, filename: str, content: str) -> str:
+    """Writes a file in some directory, and returns its path."""
+    path = os.path.join(directory, filename)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return path
+
+
+def setup_knowledges(directory: str, scale: int) -> Callable[[], object]:
+    """Loading of a knowledge file."""
+    from knowledge_clustering.knowledges import KnowledgesList
+
+    kl = write(
+        directory, "default.kl", corpus.knowledge_file(corpus.corpus(scale).bags)
+    )
+    return lambda: KnowledgesList([kl])
+
+
+def setup_tex_document(directory: str, scale: int) -> Callable[[], object]:
+    """Parsing of a TeX document."""
+    from knowledge_clustering.tex_document import TexDocument
+
+    tex = corpus.tex_file(corpus.corpus(scale).bags, scale)
+    return lambda: TexDocument(tex)
+
+
+def setup_anchor(directory: str, scale: int) -> Callable[[], object]:
+    """Search of missing anchor points in a parsed TeX document."""
+    from knowledge_clustering.add_anchor import missing_anchor
+    from knowledge_clustering.tex_document import TexDocument
+
+    tex_doc = TexDocument(corpus.tex_file(corpus.corpus(scale).bags, scale))
+    out = io.StringIO()
+    return lambda: missing_anchor(tex_doc, 200, out)
+
+
+def setup_addquotes(directory: str, scale: int) -> Callable[[], object]:
+    """Addition of all missing quotes to a parsed TeX document."""
+    from knowledge_clustering.add_quotes import insert_quotes, quote_maximal_substrings
+    from knowledge_clustering.knowledges import KnowledgesList
+    from knowledge_clustering.tex_document import TexDocument
+
+    bags = corpus.corpus(scale).bags
+    kls = KnowledgesList([write(directory, "default.kl", corpus.knowledge_file(bags))])
+    tex_doc = TexDocument(corpus.tex_file(bags, scale))
+    out = io.StringIO()
+
+    def run():
+        quotes, _ = quote_maximal_substrings(tex_doc, kls, 0, Answers(), out)  # type: ignore
+        return "".join(insert_quotes(tex_doc, quotes))
+
+    return run
+
+
+def setup_cluster(directory: str, scale: int) -> Callable[[], object]:
+    """Clustering of the knowledges of a diagnose file, from the files to the files."""
+    from knowledge_clustering import clustering
+
+    c = corpus.corpus(scale)
+    kl = corpus.knowledge_file(c.bags)
+    dg = write(directory, "document.diagnose", corpus.diagnose_file(c.unknown))
+
+    def run():
+        # The knowledge file is overwritten by the clustering
+        kl_filename = write(directory, "default.kl", kl)
+        return clustering.app([kl_filename], dg, False, False, "en", None)
+
+    return run
+
+
+def setup_startup(directory: str, scale: int) -> Callable[[], object]:
+    """Cold start of the anchor command in a new process; `scale` is ignored."""
+    tex = write(directory, "document.tex", corpus.tex_file(corpus.corpus(1).bags, 1))
+    script = (
+        "from knowledge_clustering.scripts.app import cli\n"
+        + f"cli(['anchor', '--no-update', '-t', {tex!r}])"
+    )
+    return lambda: subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, check=True
+    )
+
+
+BENCHMARKS: dict[str, Callable[[str, int], Callable[[], object]]] = {
+    "knowledges": setup_knowledges,
+    "tex-document": setup_tex_document,
+    "anchor": setup_anchor,
+    "addquotes": setup_addquotes,
+    "cluster": setup_cluster,
+    "startup": setup_startup,
+}
+
+
+def measure(name: str, scale: int, repeat: int) -> Result:
+    """Runs a benchmark in the current process."""
+    times = []
+    with tempfile.TemporaryDirectory() as directory:
+        stdout = sys.stdout
+        with open(os.devnull, "w", encoding="utf-8") as sys.stdout:
+            try:
+                for _ in range(repeat):
+                    bench = BENCHMARKS[name](directory, scale)
+                    start = time.perf_counter()
+                    bench()
+                    times.append(time.perf_counter() - start)
+                bench = BENCHMARKS[name](directory, scale)
+                tracemalloc.start()
+                bench()
+                _, memory = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            finally:
+                sys.stdout = stdout
+    return Result(min(times), memory)
+
+
+def run_in_subprocess(name: str, scale: int, repeat: int) -> Result | str:
+    """
+    Runs a benchmark in a fresh Python process. Returns its result, or the
+    error message if it failed.
+    """
+    process = subprocess.run(
+        [sys.executable, "-m", "benchmarks.run", "--run-one", name, str(scale)]
+        + ["--repeat", str(repeat)],
+        cwd=Path(__file__).parent.parent,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if process.returncode != 0:
+        lines = process.stderr.strip().splitlines()
+        return (
+            click.unstyle(lines[-1])[:200]
+            if lines
+            else f"exit code {process.returncode}"
+        )
+    return Result(**json.loads(process.stdout))
+
+
+def key(name: str, scale: int) -> str:
+    """Returns the key of a benchmark in the baseline file."""
+    return f"{name}@{scale}"
+
+
+def print_result(name: str, scale: int, result: Result, baseline: dict) -> bool:
+    """
+    Prints the result of a benchmark, compared to the baseline if there is one.
+    Returns whether the benchmark is slower than its baseline by more than
+    `REGRESSION_THRESHOLD`.
+    """
+    line = (
+        f"{name:<14}{scale:>5}×{result.time:>10.3f} s{result.memory / 2**20:>10.1f} MiB"
+    )
+    regression = False
+    if key(name, scale) in baseline:
+        base = Result(**baseline[key(name, scale)])
+        ratio = result.time / base.time if base.time > 0 else 1.0
+        regression = ratio > REGRESSION_THRESHOLD
+        line += f"{ratio:>9.2f}× time{result.memory / max(base.memory, 1):>7.2f}× mem"
+        if regression:
+            line += "  REGRESSION"
+    print(line)
+    return regression
+
+
+@click.command()
+@click.option(
+    "--scale",
+    "-s",
+    "scales",
+    type=click.IntRange(min=1),
+    multiple=True,
+    help="Scale of the corpus, relatively to the phd corpus. Can be repeated.",
+)
+@click.option(
+    "--benchmark",
+    "-b",
+    "names",
+    type=click.Choice(list(BENCHMARKS)),
+    multiple=True,
+    help="Benchmark to run. Can be repeated. By default, all benchmarks are run.",
+)
+@click.option(
+    "--repeat",
+    "-r",
+    type=click.IntRange(min=1),
+    default=3,
+    show_default=True,
+    help="Number of runs of each benchmark, of which the fastest is kept.",
+)
+@click.option("--save", is_flag=True, help="Stores the results as the baseline.")
+@click.option(
+    "--compare",
+    is_flag=True,
+    help="Compares the results to the baseline, and fails if some benchmark is "
+    + f"slower than its baseline by more than {REGRESSION_THRESHOLD}×.",
+)
+@click.option("--run-one", nargs=2, type=(str, int), default=None, hidden=True)
+def main(
+    scales: tuple[int, ...],
+    names: tuple[str, ...],
+    repeat: int,
+    save: bool,
+    compare: bool,
+    run_one: tuple[str, int] | None,
+):
+    """
+    Benchmarks the commands of knowledge-clustering on synthetic corpora.
+    """
+    if run_one is not None:
+        print(json.dumps(measure(run_one[0], run_one[1], repeat)._asdict()))
+        return
+    baseline: dict = {}
+    if compare and BASELINE_FILE.exists():
+        with open(BASELINE_FILE, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    results: dict[str, dict] = {}
+    regressions = []
+    for scale in scales or DEFAULT_SCALES:
+        for name in names or BENCHMARKS:
+            result = run_in_subprocess(name, scale, repeat)
+            if isinstance(result, str):
+                print(f"{name:<14}{scale:>5}×  failed: {result}")
+                continue
+            results[key(name, scale)] = result._asdict()
+            if print_result(name, scale, result, baseline):
+                regressions.append(key(name, scale))
+    if save:
+        if BASELINE_FILE.exists():
+            with open(BASELINE_FILE, encoding="utf-8") as f:
+                results = json.load(f)["results"] | results
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump({"machine": platform.platform(), "results": results}, f, indent=2)
+            f.write("\n")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
@@ -4,15 +4,34 @@ Adding anchor points to a document.
 
 from __future__ import annotations  # Support of `|` for type union in Python 3.9
 
+import bisect
+import io
 import re  # Regular expressions
-from typing import TextIO
+from typing import Any, TextIO
 import sys
 
-from knowledge_clustering.tex_document import TexDocument
-from knowledge_clustering import misc, cst
+from knowledge_clustering.tex_document import TexDocument, UNDEFINED
+from knowledge_clustering import misc, cst, tex_project
+from knowledge_clustering import instrumentation as instr
 
+# End of an introduction of a knowledge, given its beginning
+END_DELIMITER: dict[str, str] = dict(cst.INTRO_DELIMITERS)
+# Beginnings of introductions of knowledges and anchor points, longest first
+TOKENS: re.Pattern = re.compile(
+    "|".join(
+        re.escape(s)
+        for s in sorted(set(END_DELIMITER) | set(cst.AP_STRING), key=len, reverse=True)
+    )
+)
 
-def app(tex_filename: str, space: int, out: TextIO = sys.stdout) -> None:
+
+def app(
+    tex_filename: str,
+    space: int,
+    out: TextIO = sys.stdout,
+    project: bool = False,
+    jobs: int = 1,
+) -> None:
     """
     Prints warning when a knowledge is introduced but is not preceded by an anchor point.
     Args:
@@ -20,13 +39,49 @@ def app(tex_filename: str, space: int, out: TextIO = sys.stdout) -> None:
         space: an integer specifying the maximal number of characters allowed between the
             introduction of a knowledge and an anchor point.
         out: an output stream.
+        project: a boolean specifying whether the files included by the tex file,
+            recursively, should also be processed.
+        jobs: the number of processes used to process the files.
     """
-    with open(tex_filename, "r", encoding="utf-8") as f:
-        tex_doc = TexDocument(f.read())
-    return missing_anchor(tex_doc, space, out)
+    with instr.stage("TeX project"):
+        tex_filenames = (
+            tex_project.project_files(tex_filename, out) if project else [tex_filename]
+        )
+    warnings = tex_project.map_files(
+        anchor_file, tex_filenames, jobs, init_worker, (space, project)
+    )
+    out.writelines(warnings)
+
+
+# State of the processes searching for missing anchor points, set by init_worker
+WORKER_STATE: dict[str, Any] = {}
+
+
+def init_worker(space: int, print_filename: bool) -> None:
+    """Initialises a process searching for missing anchor points."""
+    WORKER_STATE["space"] = space
+    WORKER_STATE["print_filename"] = print_filename
+
+
+def anchor_file(tex_filename: str) -> str:
+    """Returns the warnings printed by missing_anchor on a tex file."""
+    with instr.stage("TeX document"):
+        with open(tex_filename, "r", encoding="utf-8") as f:
+            tex_doc = TexDocument(f.read())
+    with instr.stage("anchor points"):
+        out = io.StringIO()
+        missing_anchor(
+            tex_doc,
+            WORKER_STATE["space"],
+            out,
+            tex_filename if WORKER_STATE["print_filename"] else None,
+        )
+        return out.getvalue()
 
 
-def missing_anchor(tex_doc: TexDocument, space: int, out: TextIO) -> None:
+def missing_anchor(
+    tex_doc: TexDocument, space: int, out: TextIO, filename: str | None = None
+) -> None:
     """
     Prints line numbers containing the introduction of a knowledge which
     is further away from an anchor point than the integer given as input.
@@ -36,29 +91,41 @@ def missing_anchor(tex_doc: TexDocument, space: int, out: TextIO) -> None:
         space: the maximal distance between the introduction of a
             knowledge and the anchor point preceeding it.
         out: an output stream.
+        filename: if given, the name of the file of the document, printed
+            together with line numbers.
     """
-    # First, compute the list of pairs (i1,i2,i3,i4) corresponding to
-    # the indices in s = tex_doc.tex_cleaned of some pair in cst.INTRO_DELIMITERS, i.e.
-    # (s[i1:i2], s[i3:i4]) is in cst.INTRO_DELIMITERS
+    tex_cleaned: str = tex_doc.tex_cleaned
+    # Single pass over s = tex_doc.tex_cleaned, collecting the tuples (i1,i2,i3,i4)
+    # such that (s[i1:i2], s[i3:i4]) is in cst.INTRO_DELIMITERS, sorted by i1,
+    # and the start and end indices of the anchor points.
     matches: list[tuple[int, int, int, int]] = []
-    is_end_of_match = [False for _ in range(len(tex_doc.tex_cleaned))]
-    for beg_str, end_str in cst.INTRO_DELIMITERS:
-        for i_match in re.finditer(re.escape(beg_str), tex_doc.tex_cleaned):
-            i1: int = i_match.start()
-            i2: int = i_match.end()
-            if not is_end_of_match[i1]:
-                i3: int = i2 + tex_doc.tex_cleaned[i2:].find(end_str)
-                i4: int = i3 + len(end_str)
-                if i3 != -1:
-                    matches.append((i1, i2, i3, i4))
-                    is_end_of_match[i3] = True
-    matches.sort(key=lambda x: x[0])
+    ap_starts: list[int] = []
+    ap_ends: list[int] = []
+    ends_of_matches: set[int] = set()
+    for token in TOKENS.finditer(tex_cleaned):
+        i1, i2 = token.span()
+        end_str: str | None = END_DELIMITER.get(token.group())
+        if end_str is None:
+            ap_starts.append(i1)
+            ap_ends.append(i2)
+        elif i1 not in ends_of_matches:
+            i3: int = tex_cleaned.find(end_str, i2)
+            if i3 != -1:
+                matches.append((i1, i2, i3, i3 + len(end_str)))
+                ends_of_matches.add(i3)
     for i1, i2, i3, _ in matches:
-        beg: int = max(0, i1 - space)
-        if not any(ap_str in tex_doc.tex_cleaned[beg:i1] for ap_str in cst.AP_STRING):
-            start_pt: int | None = tex_doc.pointer[i1]
-            if start_pt is not None:
-                message: str = f"Missing anchor point at line {tex_doc.find_line[start_pt]} (knowledge: {misc.emph(tex_doc.tex_cleaned[i2:i3])})."
+        # Anchor points do not overlap, so the last one ending before i1 is the one
+        # that starts the latest.
+        k: int = bisect.bisect_right(ap_ends, i1) - 1
+        if k < 0 or ap_starts[k] < max(0, i1 - space):
+            start_pt: int = tex_doc.pointer[i1]
+            if start_pt != UNDEFINED:
+                line: str = f"line {tex_doc.find_line(start_pt)}"
+                if filename is not None:
+                    line += f" of {filename}"
+                message: str = (
+                    f"Missing anchor point at {line} (knowledge: {misc.emph(tex_cleaned[i2:i3])})."
+                )
                 print(message, file=out)
             else:
                 raise IndexError("Undefined pointer", tex_doc.pointer, i1)
@@ -4,13 +4,16 @@ Add missing quotes around knowledges occuring in a TeX document.
 
 from __future__ import annotations  # Support of `|` for type union in Python 3.9
 
-import re  # Regular expressions
-from typing import NamedTuple, TextIO
+from typing import Any, Iterator, NamedTuple, TextIO
+import bisect
+import difflib
+import json
 import sys
 
 from knowledge_clustering.knowledges import KnowledgesList, remove_redundant_files
-from knowledge_clustering.tex_document import TexDocument
-from knowledge_clustering import file_updater, misc, cst
+from knowledge_clustering.tex_document import TexDocument, UNDEFINED
+from knowledge_clustering import aho_corasick, file_updater, misc, cst, tex_project
+from knowledge_clustering import instrumentation as instr
 
 
 class NewKL(NamedTuple):
@@ -38,6 +41,30 @@ class AddQuote(NamedTuple):
     end: int
 
 
+class TexQuotes(NamedTuple):
+    """
+    Stores the positions of some TeX file before and after which quotes are added.
+    """
+
+    filename: str
+    code: str
+    hash: Any  # Hash of the file when it was read, see file_updater.hash_file
+    quote_before: set[int]
+    quote_after: set[int]
+
+
+class Decisions:
+    """
+    Answers of the user that are remembered from one question to the next, and from
+    one file of a project to the next.
+    """
+
+    def __init__(self) -> None:
+        self.new_kl_set: set[str] = set()  # Knowledges accepted as synonyms
+        self.ignore_synonym: set[str] = set()
+        self.ignore_subknowledge: set[str] = set()
+
+
 def ask_consent(message: str, inp: TextIO, out: TextIO):
     """
     Asks whether the user wants to do an action, after printing the string `message`.
@@ -48,12 +75,21 @@ def ask_consent(message: str, inp: TextIO, out: TextIO):
     return ans.lower() in ["y", "yes"]
 
 
+class OutdatedQuotes(Exception):
+    """When quotes are applied to a file that was modified since they were found."""
+
+
 def app(
     tex_filename: str,
     kl_filenames: list[str],
     print_line: int,
     inp: TextIO = sys.stdin,
     out: TextIO = sys.stdout,
+    policy: str | None = None,
+    json_filename: str | None = None,
+    diff: bool = False,
+    project: bool = False,
+    jobs: int = 1,
 ) -> None:
     """
     Finds knowledges defined in the knowledge file that appear in tex file without quote
@@ -64,20 +100,210 @@ def app(
         print_line: an integer specifying how many lines of the tex file should be printed.
         inp: input stream.
         out: output stream.
+        policy: if given, a key of cst.ADDQUOTES_POLICIES; nothing is asked to the
+            user, and the questions are answered according to this policy.
+        json_filename: if given, the quotes to add and the new synonyms are written
+            to this file, to be applied later by `apply`, and no other file is modified.
+        diff: a boolean specifying whether the changes should be printed as a unified
+            diff instead of being written to the files.
+        project: a boolean specifying whether the files included by the tex file,
+            recursively, should also be processed.
+        jobs: the number of processes used to search knowledges in the tex files.
     """
-    tex_hash = file_updater.hash_file(tex_filename)
-    with open(tex_filename, "r", encoding="utf-8") as f:
-        tex_doc = TexDocument(f.read())
-    f.close()
-    kls = KnowledgesList(remove_redundant_files(kl_filenames))
-    tex_document_new, new_knowledges = quote_maximal_substrings(
-        tex_doc, kls, print_line, inp, out
+    with instr.stage("TeX project"):
+        tex_filenames = (
+            tex_project.project_files(tex_filename, out) if project else [tex_filename]
+        )
+        tex_hashes = [file_updater.hash_file(filename) for filename in tex_filenames]
+    with instr.stage("knowledge files"):
+        kls = KnowledgesList(remove_redundant_files(kl_filenames))
+    with instr.stage("matcher"):
+        matcher = Matcher(kls)
+    # Every tex file is read and searched for knowledges in some process, while the
+    # questions are asked, file after file, in the main process
+    documents = tex_project.map_files(
+        search_file, tex_filenames, jobs, init_worker, (matcher,)
     )
-    with file_updater.AtomicUpdate(tex_filename, original_hash=tex_hash) as f:
-        f.write(tex_document_new)
-    f.close()
+    decisions = Decisions()
+    tex_quotes: list[TexQuotes] = []
+    json_files: list[dict[str, Any]] = []
+    new_knowledges: list[tuple[str, str]] = []
+    with instr.stage("adding quotes"):
+        for filename, tex_hash, (tex_doc, operations) in zip(
+            tex_filenames, tex_hashes, documents
+        ):
+            if project:
+                print(f"{misc.emph(filename)}:", file=out)
+            quotes, synonyms = add_quote(
+                tex_doc, operations, print_line, inp, out, policy, decisions
+            )
+            new_knowledges += synonyms
+            tex_quotes.append(
+                TexQuotes(
+                    filename,
+                    tex_doc.tex_code,
+                    tex_hash,
+                    {tex_doc.pointer[op.start] for op in quotes},
+                    {tex_doc.pointer[op.end] for op in quotes},
+                )
+            )
+            json_files.append(
+                {
+                    "tex": filename,
+                    "hash": tex_hash.hexdigest(),
+                    "quotes": [
+                        {
+                            "knowledge": op.kl,
+                            "start": tex_doc.pointer[op.start],
+                            "end": tex_doc.pointer[op.end],
+                            "line": tex_doc.find_line(tex_doc.pointer[op.start]),
+                        }
+                        for op in quotes
+                    ],
+                }
+            )
+    with instr.stage("writing"):
+        if json_filename is not None:
+            with open(json_filename, "w", encoding="utf-8") as f:
+                json.dump(
+                    (
+                        {"files": json_files, "synonyms": new_knowledges}
+                        if project
+                        else json_files[0] | {"synonyms": new_knowledges}
+                    ),
+                    f,
+                    ensure_ascii=False,
+                    indent=1,
+                )
+            return
+        update_files(tex_quotes, kls, new_knowledges, diff, out)
+
+
+# State of the processes searching for knowledges in tex files, set by init_worker
+WORKER_STATE: dict[str, Any] = {}
+
+
+def init_worker(matcher: Matcher) -> None:
+    """Initialises a process searching for knowledges with some matcher."""
+    WORKER_STATE["matcher"] = matcher
+
+
+def search_file(
+    tex_filename: str,
+) -> tuple[TexDocument, list[NewKL | AddQuote]]:
+    """
+    Reads a tex file, and finds the knowledges occurring in it without quotes,
+    see find_quotes.
+    """
+    with instr.stage("TeX document"):
+        with open(tex_filename, "r", encoding="utf-8") as f:
+            tex_doc = TexDocument(f.read())
+    with instr.stage("search of knowledges"):
+        return tex_doc, find_quotes(tex_doc, WORKER_STATE["matcher"])
+
+
+def apply(
+    json_filename: str,
+    tex_filename: str,
+    kl_filenames: list[str],
+    diff: bool = False,
+    out: TextIO = sys.stdout,
+) -> None:
+    """
+    Adds the quotes and defines the synonyms stored in a file written by `app`, and
+    prints how many of them were added, unless the changes are printed as a diff.
+    Raises OutdatedQuotes if a tex file was modified since, or if some synonym is
+    defined for a knowledge that is not in the knowledge files.
+    Args:
+        json_filename: the name of the file written by `app`.
+        tex_filename: the name of the tex file, unless the file was written for
+            a project, in which case it stores the names of its tex files.
+        kl_filenames: the names of the knowledge files.
+        diff: a boolean specifying whether the changes should be printed as a unified
+            diff instead of being written to the files.
+        out: output stream.
+    """
+    with open(json_filename, "r", encoding="utf-8") as f:
+        content = json.load(f)
+    # The quotes of a project are stored file by file
+    files = (
+        content["files"] if "files" in content else [content | {"tex": tex_filename}]
+    )
+    tex_quotes: list[TexQuotes] = []
+    for file in files:
+        tex_hash = file_updater.hash_file(file["tex"])
+        if file["hash"] != tex_hash.hexdigest():
+            raise OutdatedQuotes(
+                f"The file {file['tex']} was modified since {json_filename} was written."
+            )
+        with open(file["tex"], "r", encoding="utf-8") as f:
+            tex_code = f.read()
+        tex_quotes.append(
+            TexQuotes(
+                file["tex"],
+                tex_code,
+                tex_hash,
+                {quote["start"] for quote in file["quotes"]},
+                {quote["end"] for quote in file["quotes"]},
+            )
+        )
+    kls = KnowledgesList(remove_redundant_files(kl_filenames))
+    new_knowledges: list[tuple[str, str]] = list(map(tuple, content["synonyms"]))
+    try:
+        update_files(tex_quotes, kls, new_knowledges, diff, out)
+    except KeyError as e:
+        raise OutdatedQuotes(
+            f"The knowledge {e.args[0]} of {json_filename} is not defined."
+        ) from e
+    if not diff:
+        print_summary(
+            sum(len(tq.quote_before) for tq in tex_quotes), len(new_knowledges), out
+        )
+
+
+def update_files(
+    tex_quotes: list[TexQuotes],
+    kls: KnowledgesList,
+    new_knowledges: list[tuple[str, str]],
+    diff: bool,
+    out: TextIO,
+) -> None:
+    """
+    Adds quotes to the tex files before and after the given positions, and defines the
+    new synonyms in the knowledge files; or prints these changes as a unified diff.
+    """
     for known_kl, new_kl in new_knowledges:
         kls.define_synonym_of(new_kl, known_kl)
+    if diff:
+        changes = [
+            (
+                tq.filename,
+                tq.code,
+                splice_quotes(tq.code, tq.quote_before, tq.quote_after),
+            )
+            for tq in tex_quotes
+        ]
+        for kl in kls.get_all_kls_struct():
+            if kl.was_changed():
+                with open(kl.filename, "r", encoding="utf-8") as f:
+                    changes.append(
+                        (str(kl.filename), f.read(), kl.lines(nocomment=True))
+                    )
+        for filename, old, new in changes:
+            out.writelines(
+                difflib.unified_diff(
+                    old.splitlines(keepends=True),
+                    "".join(new).splitlines(keepends=True),
+                    filename,
+                    filename,
+                )
+            )
+        return
+    for tq in tex_quotes:
+        if tq.quote_before or tq.quote_after:
+            with file_updater.AtomicUpdate(tq.filename, original_hash=tq.hash) as f:
+                f.writelines(splice_quotes(tq.code, tq.quote_before, tq.quote_after))
+            f.close()
     kls.write_knowledges_in_file(nocomment=True)
 
 
@@ -87,12 +313,16 @@ def add_quote(
     print_line: int,
     inp: TextIO,
     out: TextIO,
-) -> tuple[str, list[tuple[str, str]]]:
+    policy: str | None = None,
+    decisions: Decisions | None = None,
+) -> tuple[list[AddQuote], list[tuple[str, str]]]:
     """
     In the TeX document, for every operation of type AddQuote, proposes to add quotes before
     and after the match with the knowledge.
     For every operation of type NewKL, proposes to define a new knowledge, and to add
     quotes before and after the match.
+    Returns the list of quotes to add, that can be inserted in the document using
+    insert_quotes, together with the list of pairs (known knowledge, new synonym).
 
     Args:
         tex_doc: a TeX document.
@@ -100,49 +330,77 @@ def add_quote(
         print_line: an integer specifying how many lines of the tex file should be printed.
         inp: an input stream.
         out: an output stram.
+        policy: if given, a key of cst.ADDQUOTES_POLICIES; nothing is asked to the
+            user, and the questions are answered according to this policy.
+        decisions: if given, the answers of the user to previous questions, for instance
+            on other files of a project, which are updated with the new answers.
     Given a tex code, and a list of triples (_, start, end), add a quote before the
     start and after the end. If the boolean interactive if true, asks the user
     if they want to add quotes: moreover, print the print_line lines preceding
     the match before asking the user's input.
     """
-    result: str = ""
+
+    def consent(question: str, message: str, op: NewKL | AddQuote | None) -> bool:
+        """
+        Asks the user a question, after printing the match of `op` if it is given.
+        In batch mode, answers according to the policy instead.
+        """
+        if policy is not None:
+            return question in cst.ADDQUOTES_POLICIES[policy]
+        if op is not None:
+            tex_doc.print(op.start, op.end, print_line, out)
+        return ask_consent(message, inp, out)
+
+    if decisions is None:
+        decisions = Decisions()
     new_knowledges: list[tuple[str, str]] = []
-    ignore_synonym = []
-    ignore_subknowledge = []
-    operations.sort(key=lambda x: x.start)
+    new_kl_set = decisions.new_kl_set
+    ignore_synonym = decisions.ignore_synonym
+    ignore_subknowledge = decisions.ignore_subknowledge
+    operations = sorted(operations, key=lambda x: x.start)
+    # Operations are indexed by their start, so that the operations occurring in some
+    # interval are found by binary search; removed operations are never proposed
+    starts: list[int] = [op.start for op in operations]
+    removed: set[int] = set()
     operations_addquote: list[AddQuote] = []
-    for op in operations:
+    for op_id, op in enumerate(operations):
+        if op_id in removed:
+            continue
         if isinstance(op, NewKL):
             if op.kl not in ignore_synonym:
-                if op.kl not in [k for (_, k) in new_knowledges]:
+                if op.kl not in new_kl_set:
                     # Propose to the user to define a synonym
-                    tex_doc.print(op.start, op.end, print_line, out)
                     message = (
                         f"Do you want to add `{misc.emph_alt(op.kl)}` as a synonym "
                         f"of `{misc.emph_alt(op.kl_origin)}` and add quotes? [y/n] "
                     )
-                    if ask_consent(message, inp, out):
+                    if consent("synonym", message, op):
                         # Adds op.kl as a new knowledge, defined as a synonym of op.kl_origin
                         new_knowledges.append((op.kl_origin, op.kl))
+                        new_kl_set.add(op.kl)
                         operations_addquote.append(AddQuote(op.kl, op.start, op.end))
-                        # Removes any operations occuring on a substring of our new knowledge
-                        for op2 in operations:
-                            if isinstance(op2, AddQuote):
-                                if op.start <= op2.start and op2.end <= op.end:
-                                    operations.remove(op2)
+                        # Removes the next operations occuring on a substring of our
+                        # new knowledge
+                        for op2_id in range(
+                            op_id + 1, bisect.bisect_right(starts, op.end)
+                        ):
+                            op2 = operations[op2_id]
+                            if isinstance(op2, AddQuote) and op2.end <= op.end:
+                                removed.add(op2_id)
                     else:
                         # From this point, do not propose again to define op.kl as a new knowledge.
-                        ignore_synonym.append(op.kl)
+                        ignore_synonym.add(op.kl)
                         if (
                             op.kl_origin
                             == tex_doc.tex_code[op.start_origin : op.end_origin + 1]
                         ):
                             # Propose to the user to add quotes around the original knowledge
-                            # instead, if we have a precise match.
-                            if ask_consent(
+                            # instead, if we have a precise match. This would add quotes
+                            # inside a word, hence no policy accepts it in batch mode.
+                            if consent(
+                                "subword",
                                 f"Add quotes around `{misc.emph(op.kl_origin)}` instead? [y/n] ",
-                                inp,
-                                out,
+                                None,
                             ):
                                 operations_addquote.append(
                                     AddQuote(
@@ -150,8 +408,9 @@ def add_quote(
                                     )
                                 )
                             else:
-                                ignore_subknowledge.append(op.kl)
-                    print("", file=out)
+                                ignore_subknowledge.add(op.kl)
+                    if policy is None:
+                        print("", file=out)
                 else:
                     # If op.kl was already accepted as a synonym earlier, treat it
                     # as a regular knowledge
@@ -161,28 +420,95 @@ def add_quote(
                 # to add quotes around op.kl_origin
                 op = AddQuote(op.kl_origin, op.start_origin, op.end_origin)
         elif isinstance(op, AddQuote):
-            tex_doc.print(op.start, op.end, print_line, out)
-            if ask_consent("Add quotes? [y/n] ", inp, out):
+            if consent("quote", "Add quotes? [y/n] ", op):
                 operations_addquote.append(op)
-            print("", file=out)
-    add_quote_before = [tex_doc.pointer[op.start] for op in operations_addquote]
-    add_quote_after = [tex_doc.pointer[op.end] for op in operations_addquote]
-    # Simply add quotes before and after every positions corresponding to the beginning / end of
-    # a match with a knowledge.
-    for i, char in enumerate(tex_doc.tex_code):
-        if i in add_quote_before:
-            result += '"'
-        result += char
-        if i in add_quote_after:
-            result += '"'
+            if policy is None:
+                print("", file=out)
+    print_summary(len(operations_addquote), len(new_knowledges), out)
+    return operations_addquote, new_knowledges
+
+
+def print_summary(nb_quotes: int, nb_synonyms: int, out: TextIO) -> None:
+    """Prints the number of pairs of quotes added and of synonyms defined."""
     print(
-        f"Added {len(operations_addquote)} pair"
-        + ("s" if len(operations_addquote) > 1 else "")
-        + f" of quotes. Defined {len(new_knowledges)} synonym"
-        + ("s." if len(new_knowledges) > 1 else "."),
+        f"Added {nb_quotes} pair"
+        + ("s" if nb_quotes > 1 else "")
+        + f" of quotes. Defined {nb_synonyms} synonym"
+        + ("s." if nb_synonyms > 1 else "."),
         file=out,
     )
-    return result, new_knowledges
+
+
+def insert_quotes(tex_doc: TexDocument, quotes: list[AddQuote]) -> Iterator[str]:
+    """
+    Returns the TeX code of the document with quotes added before and after every
+    match of `quotes`, as a sequence of chunks.
+    """
+    return splice_quotes(
+        tex_doc.tex_code,
+        {tex_doc.pointer[op.start] for op in quotes},
+        {tex_doc.pointer[op.end] for op in quotes},
+    )
+
+
+def splice_quotes(
+    tex_code: str, quote_before: set[int], quote_after: set[int]
+) -> Iterator[str]:
+    """
+    Returns the TeX code with a quote added before every position of `quote_before` and
+    after every position of `quote_after`, as a sequence of chunks. The code is sliced
+    between consecutive insertion points, so that it is never copied character by
+    character.
+    """
+    previous = 0
+    for position in sorted((quote_before | quote_after) - {UNDEFINED}):
+        yield tex_code[previous:position]
+        if position in quote_before:
+            yield '"'
+        yield tex_code[position]
+        if position in quote_after:
+            yield '"'
+        previous = position + 1
+    yield tex_code[previous:]
+
+
+def lower_letters(string: str) -> str:
+    """
+    Puts a string in lowercase, letter by letter, so that the position of
+    every letter is preserved.
+    """
+    if string.isascii():
+        return string.lower()
+    return "".join(c.lower() if len(c.lower()) == 1 else c for c in string)
+
+
+class Matcher:
+    """
+    Finds all occurrences of the knowledges of a list of knowledges in a TeX document,
+    using an Aho–Corasick automaton for the case sensitive search, and another one
+    for the case insensitive search. It is built once, and shared by the processes
+    searching the files of a project.
+    """
+
+    def __init__(self, kls: KnowledgesList):
+        # Knowledges in topological order, see KnowledgesList.get_sorted_knowledges
+        self.knowledges: list[str] = [
+            kl for kl in kls.get_sorted_knowledges() if kl != ""
+        ]
+        self.automata: dict[bool, aho_corasick.Automaton] = {
+            False: aho_corasick.Automaton(self.knowledges),
+            True: aho_corasick.Automaton([lower_letters(kl) for kl in self.knowledges]),
+        }
+
+    def occurrences(self, text: str, ignore_case: bool) -> list[list[int]]:
+        """
+        Returns, for every knowledge, the sorted list of the starting positions of its
+        occurrences in `text`, which is assumed to be in lowercase if ignore_case is true.
+        """
+        occurrences: list[list[int]] = [[] for _ in self.knowledges]
+        for start, p_id in self.automata[ignore_case].find_all(text):
+            occurrences[p_id].append(start)
+        return occurrences
 
 
 def quote_maximal_substrings(
@@ -191,10 +517,12 @@ def quote_maximal_substrings(
     print_line: int,
     inp: TextIO,
     out: TextIO,
-) -> tuple[str, list[tuple[str, str]]]:
+    policy: str | None = None,
+) -> tuple[list[AddQuote], list[tuple[str, str]]]:
     """
     Finds knowledges defined in the knowledge file that appear in tex file without quote
     symbols. Proposes to add quotes around them.
+    Returns the quotes to add and the new synonyms, see add_quote.
 
     Args:
         tex_doc: a TeX document.
@@ -202,6 +530,22 @@ def quote_maximal_substrings(
         print_line: an integer specifying how many lines of the tex file should be printed.
         inp: input stream.
         out: output stream.
+        policy: if given, the policy used to answer the questions, see add_quote.
+    """
+    with instr.stage("search of knowledges"):
+        operations = find_quotes(tex_doc, Matcher(kls))
+    with instr.stage("adding quotes"):
+        return add_quote(tex_doc, operations, print_line, inp, out, policy)
+
+
+def find_quotes(tex_doc: TexDocument, matcher: Matcher) -> list[NewKL | AddQuote]:
+    """
+    Finds the knowledges occurring in a TeX document without quote symbols.
+    Returns the list of operations proposed to the user by add_quote.
+
+    Args:
+        tex_doc: a TeX document.
+        matcher: the matcher of the knowledges.
     """
 
     def stop_expanding(char):
@@ -211,23 +555,27 @@ def quote_maximal_substrings(
     add_quote_location: list[NewKL | AddQuote] = []
     for ignore_case in [False, True]:
         # Start the algo by being case sensitive, then run it while being insensitive.
-        for s1 in kls.get_sorted_knowledges():
-            match_list = (
-                re.finditer(re.escape(s1), tex_doc.tex_cleaned, re.IGNORECASE)
-                if ignore_case
-                else re.finditer(re.escape(s1), tex_doc.tex_cleaned)
-            )
-            for match in match_list:
-                start, end = match.start(), match.end() - 1
+        # All occurrences of all knowledges are found in a single pass over the document.
+        text = (
+            lower_letters(tex_doc.tex_cleaned) if ignore_case else tex_doc.tex_cleaned
+        )
+        occurrences = matcher.occurrences(text, ignore_case)
+        # Knowledges are processed in topological order, and for each knowledge, its
+        # non-overlapping occurrences from left to right.
+        for s1, s1_occurrences in zip(matcher.knowledges, occurrences):
+            next_start = 0
+            for start in s1_occurrences:
+                if start < next_start:
+                    continue
+                end = start + len(s1) - 1
+                next_start = end + 1
+                if UNDEFINED in (tex_doc.pointer[start], tex_doc.pointer[end]):
+                    # The match is in a `\\par` added to the cleaned document
+                    continue
                 if not ignore_position[start]:
-                    # Ignore every infix of s1 that is also a substring of the list
+                    # Ignore every infix of s1, in particular those that are knowledges
                     for i in range(start, end + 1):
                         ignore_position[i] = True
-                    for s2 in kls.dependency[s1]:
-                        for submatch in re.finditer(
-                            re.escape(s2), tex_doc.tex_cleaned[start : end + 1]
-                        ):
-                            ignore_position[start + submatch.start()] = True
                     # Check if s1 is precedeed by quotes, if not, either check
                     # if we can define a new knowledge, or add the match to the
                     # list of quotes to add.
@@ -256,4 +604,4 @@ def quote_maximal_substrings(
                             )
                         else:
                             add_quote_location.append(AddQuote(s1, start, end))
-    return add_quote(tex_doc, add_quote_location, print_line, inp, out)
+    return add_quote_location
@@ -0,0 +1,90 @@
+"""
+Aho–Corasick automaton, finding all occurrences of a set of strings in a text
+in a single pass.
+"""
+
+from __future__ import annotations  # Support of `|` for type union in Python 3.9
+
+from typing import Iterator
+
+
+class Automaton:
+    """
+    Aho–Corasick automaton over a list of non-empty patterns.
+    https://en.wikipedia.org/wiki/Aho%E2%80%93Corasick_algorithm
+
+    States are integers, the initial state being 0. Patterns are identified by their
+    index in the list given to the constructor; the same string may occur several
+    times in this list.
+    """
+
+    def __init__(self, patterns: list[str]):
+        self.patterns: list[str] = patterns
+        self.lengths: list[int] = [len(pattern) for pattern in patterns]
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        # Patterns recognised when reaching a state
+        self.output: list[list[int]] = [[]]
+        # Closest state reachable using failure links that recognises some pattern
+        self.output_link: list[int] = [0]
+        for p_id, pattern in enumerate(patterns):
+            if pattern == "":
+                raise ValueError(
+                    "Patterns of an Aho–Corasick automaton can't be empty."
+                )
+            state = 0
+            for letter in pattern:
+                if letter not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.output_link.append(0)
+                    self.goto[state][letter] = len(self.goto) - 1
+                state = self.goto[state][letter]
+            self.output[state].append(p_id)
+        self.__compute_failure_links()
+
+    def __compute_failure_links(self) -> None:
+        """Computes failure links using a breadth-first traversal of the trie."""
+        queue: list[int] = list(self.goto[0].values())
+        i = 0
+        while i < len(queue):
+            state = queue[i]
+            i += 1
+            for letter, child in self.goto[state].items():
+                queue.append(child)
+                f = self.fail[state]
+                while f != 0 and letter not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[child] = self.goto[f].get(letter, 0)
+                self.output_link[child] = (
+                    self.fail[child]
+                    if self.output[self.fail[child]]
+                    else self.output_link[self.fail[child]]
+                )
+
+    def step(self, state: int, letter: str) -> int:
+        """Transition function of the automaton."""
+        while state != 0 and letter not in self.goto[state]:
+            state = self.fail[state]
+        return self.goto[state].get(letter, 0)
+
+    def find_all(self, text: str) -> Iterator[tuple[int, int]]:
+        """
+        Returns all pairs (start, p_id) such that the pattern p_id occurs at position
+        start in the text, by increasing order of end position.
+        """
+        goto, fail = self.goto, self.fail
+        output, output_link = self.output, self.output_link
+        lengths = self.lengths
+        state = 0
+        for i, letter in enumerate(text):
+            while state != 0 and letter not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(letter, 0)
+            # Enumerates the patterns that are suffixes of text[: i + 1]
+            s = state if output[state] else output_link[state]
+            while s != 0:
+                for p_id in output[s]:
+                    yield i - lengths[p_id] + 1, p_id
+                s = output_link[s]
@@ -1,45 +1,133 @@
 """
 Checks if there is a newer version of knowledge-clustering available on PyPI.
+
+The check runs in a background thread while the command works, and its result is
+cached on disk for UPDATE_CACHE_TTL seconds, during which PyPI is not contacted.
 """
 
-import requests
+from __future__ import annotations  # Support of `|` for type union in Python 3.9
+
+from pathlib import Path
+
+import json
+import os
+import threading
+import time
 
 from knowledge_clustering import _version
 from knowledge_clustering.misc import add_bold, add_red, add_orange, add_green
-from knowledge_clustering.cst import TIMEOUT_REQUEST
+from knowledge_clustering.cst import (
+    TIMEOUT_REQUEST,
+    TIMEOUT_UPDATE_CHECK,
+    UPDATE_CACHE_FILENAME,
+    UPDATE_CACHE_TTL,
+)
 
 
-def check_update() -> None:
+def default_cache_path() -> Path:
+    """Returns the path of the file caching the latest version available on PyPI."""
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_dir) / "knowledge-clustering" / UPDATE_CACHE_FILENAME
+
+
+def read_cache(path: Path) -> str | None:
     """
-    Checks if an update is available, and if so, prints a message in
-    the string pointer given as input.
+    Returns the latest version stored in the cache if it is fresh, and None otherwise.
+    The empty string means that the version could not be retrieved from PyPI.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            content = json.load(f)
+        if 0 <= time.time() - float(content["time"]) < UPDATE_CACHE_TTL:
+            return str(content["latest_version"])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def write_cache(path: Path, latest_version: str) -> None:
+    """Stores the latest version in the cache. Fails silently."""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"time": time.time(), "latest_version": latest_version}, f)
+    except OSError:
+        pass
+
+
+def fetch_latest_version() -> str:
+    """
+    Returns the latest version of knowledge-clustering available on PyPI,
+    or the empty string if it could not be retrieved.
     """
+    import requests  # pylint: disable=import-outside-toplevel
+
     # From https://stackoverflow.com/a/62571316/19340201
     try:
         package = "knowledge-clustering"
         response = requests.get(
             f"https://pypi.org/pypi/{package}/json", timeout=TIMEOUT_REQUEST
         )
-        latest_version: str = response.json()["info"]["version"]
-        is_available: bool = latest_version != _version.VERSION
-    except requests.exceptions.RequestException:
-        is_available = False
-        latest_version = ""
-    # If available, print message
-    msg = ""
-    if is_available:
-        msg += (
-            "\n"
-            + add_bold(add_orange("[notice]"))
-            + " A new release of knowledge-clustering is available: "
-            + add_red(_version.VERSION)
-            + " -> "
-            + add_green(latest_version)
+        return str(response.json()["info"]["version"])
+    except (requests.exceptions.RequestException, ValueError, KeyError):
+        return ""
+
+
+class UpdateCheck:
+    """
+    Looks for the latest version of knowledge-clustering, in the cache if it is fresh,
+    and otherwise on PyPI in a background thread.
+    """
+
+    def __init__(self, cache_path: Path | None = None):
+        self.cache_path: Path = (
+            default_cache_path() if cache_path is None else cache_path
         )
-        msg += (
-            "\n"
-            + add_bold(add_orange("[notice]"))
-            + " To update, run: "
-            + add_green("pipx upgrade knowledge-clustering")
+        self.latest_version: str | None = read_cache(self.cache_path)
+        self.thread: threading.Thread | None = None
+        if self.latest_version is None:
+            self.thread = threading.Thread(target=self.__fetch, daemon=True)
+            self.thread.start()
+
+    def __fetch(self) -> None:
+        latest_version = fetch_latest_version()
+        write_cache(self.cache_path, latest_version)
+        self.latest_version = latest_version
+
+    def report(self) -> None:
+        """
+        Waits at most TIMEOUT_UPDATE_CHECK seconds for the check to finish, and then
+        prints a message if an update is available.
+        """
+        if self.thread is not None:
+            self.thread.join(TIMEOUT_UPDATE_CHECK)
+        latest_version = self.latest_version
+        is_available: bool = bool(latest_version) and (
+            latest_version != _version.VERSION
         )
-    print(msg)
+        # If available, print message
+        msg = ""
+        if is_available:
+            msg += (
+                "\n"
+                + add_bold(add_orange("[notice]"))
+                + " A new release of knowledge-clustering is available: "
+                + add_red(_version.VERSION)
+                + " -> "
+                + add_green(str(latest_version))
+            )
+            msg += (
+                "\n"
+                + add_bold(add_orange("[notice]"))
+                + " To update, run: "
+                + add_green("pipx upgrade knowledge-clustering")
+            )
+        print(msg)
+
+
+def check_update() -> None:
+    """
+    Checks if an update is available, and if so, prints a message in
+    the string pointer given as input.
+    """
+    UpdateCheck().report()
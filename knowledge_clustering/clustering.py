@@ -1,11 +1,24 @@
 """Clustering algorithm."""
 
 from __future__ import annotations  # Support of `|` for type union in Python 3.9
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Any
 
+import bisect
 import copy
+import multiprocessing
 
-from knowledge_clustering import distance, config, scope_meaning, diagnose, cst
+from knowledge_clustering import (
+    distance,
+    config,
+    scope_meaning,
+    diagnose,
+    nlp_cache,
+    cst,
+)
+from knowledge_clustering import instrumentation as instr
+from knowledge_clustering import incremental as incremental_state
 from knowledge_clustering.knowledges import KnowledgesList, remove_redundant_files
 from knowledge_clustering.misc import emph
 
@@ -17,6 +30,9 @@ def app(
     print_kl: bool,
     lang: str,
     config_filename: None | Path,
+    cache: bool = False,
+    incremental: bool = False,
+    jobs: int = 1,
 ):
     """
     Defines, as a comment and in the knowledge file, all the knowledges occuring
@@ -27,33 +43,70 @@ def app(
         scope: a boolean specifying whether the scopes meaning should be printed.
         lang: the langage of the document.
         config_filename: a configuration file, specifying prefixes to ignore.
+        cache: a boolean specifying whether the features of notions should be read from
+            and written to a cache next to the default knowledge file.
+        incremental: a boolean specifying whether the state of the previous run, stored
+            in the cache, should be reused. Knowledges that were added by the previous
+            runs to knowledge files that were not modified since are added back to the
+            same bags, instead of being clustered again.
+        jobs: the number of processes used to compute distances between knowledges.
     """
-    kls = KnowledgesList(remove_redundant_files(kl_filename))
+    with instr.stage("knowledge files"):
+        kls = KnowledgesList(remove_redundant_files(kl_filename))
+    cache_path = nlp_cache.cache_path(kls.default_fn)
+    if cache:
+        with instr.stage("NLP cache"):
+            nlp_cache.load(cache_path, cst.NLTK_LANG[lang])
+    state = incremental_state.State({}, None)
+    if incremental:
+        with instr.stage("incremental state"):
+            state = incremental_state.load(cache_path, kls, cst.NLTK_LANG[lang])
 
     if config_filename is None:
         config_filename = cst.CONFIG_FILE[lang]
 
     list_prefixes = config.parse(config_filename)
 
-    scopes_meaning = scope_meaning.infer_all_scopes(
-        kls.get_all_bags(), cst.NLTK_LANG[lang]
-    )
+    if state.scopes_meaning is not None:
+        scopes_meaning = state.scopes_meaning
+    else:
+        with instr.stage("scopes meaning"):
+            scopes_meaning = scope_meaning.infer_all_scopes(
+                kls.get_all_bags(), cst.NLTK_LANG[lang]
+            )
     if scope:
         scope_meaning.print_scopes(scopes_meaning, print_meaning=True)
-    unknown_knowledges = diagnose.parse(dg_filename)
+    with instr.stage("diagnose file"):
+        unknown_knowledges = diagnose.parse(dg_filename)
+    if incremental:
+        with instr.stage("incremental state"):
+            unknown_knowledges = incremental_state.replay(
+                kls, state, unknown_knowledges
+            )
+    if cache:
+        with instr.stage("NLP cache"):
+            nlp_cache.save(
+                cache_path,
+                kls.get_all_knowledges() + unknown_knowledges,
+                cst.NLTK_LANG[lang],
+            )
 
-    if len(unknown_knowledges) == 0:
+    if len(unknown_knowledges) == 0 and (
+        not incremental or incremental_state.unchanged(kls, state)
+    ):
         return
 
     # update `kl` using the clustering algorithm
-    clustering(
-        kls,
-        unknown_knowledges,
-        cst.ALPHA,
-        list_prefixes,
-        scopes_meaning,
-        cst.NLTK_LANG[lang],
-    )
+    with instr.stage("clustering"):
+        clustering(
+            kls,
+            unknown_knowledges,
+            cst.ALPHA,
+            list_prefixes,
+            scopes_meaning,
+            cst.NLTK_LANG[lang],
+            jobs,
+        )
     print(
         f"Found a solution by adding {len(kls.get_new_bags())} new bag"
         + ("s" if len(kls.get_new_bags()) >= 2 else "")
@@ -76,7 +129,185 @@ def app(
             for kl in kls.get_new_knowledges_in_file(fn):
                 msg += f"\t{kl}\n"
     print(msg)
-    kls.write_knowledges_in_file()
+    with instr.stage("writing"):
+        kls.write_knowledges_in_file()
+    if incremental:
+        with instr.stage("incremental state"):
+            incremental_state.save(cache_path, kls, scopes_meaning, cst.NLTK_LANG[lang])
+
+
+class CandidateIndex:
+    """
+    Inverted index from word keys to processed knowledges, used by the clustering
+    algorithm to only compute the distance between pairs of knowledges that can
+    possibly be at distance at most alpha.
+
+    The keys of a word are its forms and roots, see distance.RootIndex.
+    A pair of notions whose words share no key has no pair of similar words, and hence
+    their distance is at least the sum of their number of words (or infinite).
+    Such a pair is a candidate only if both notions have at most alpha words.
+
+    Knowledges are numbered in the order in which they are processed; those whose
+    number is at least `self.start` are the "newly processed" ones.
+    """
+
+    def __init__(
+        self,
+        alpha: float,
+        prefixes: tuple[str, ...],
+        scopes_meaning: dict[str, list[list[str]]],
+        lang: str,
+    ):
+        self.alpha: float = alpha
+        self.prefixes: tuple[str, ...] = prefixes
+        self.scopes_meaning: dict[str, list[list[str]]] = scopes_meaning
+        self.lang: str = lang
+        self.processed: list[distance.NotionFeatures] = []
+        self.postings: dict[str, list[int]] = {}
+        self.small: list[int] = []
+        self.start: int = 0
+        self.notion_keys: dict[str, set[str]] = {}
+        self.roots: distance.RootIndex = distance.root_index(prefixes, lang)
+
+    def keys(self, features: distance.NotionFeatures) -> set[str]:
+        """
+        Returns the keys of all words that can occur when computing a distance
+        with some notion, including the words of the possible meanings of its scope.
+        """
+        if features.notion not in self.notion_keys:
+            keys: set[str] = set()
+            for w in features.words:
+                keys.update(self.roots.keys(w))
+            if features.scope != "":
+                for meaning in self.scopes_meaning.get(
+                    features.scope, [[features.scope]]
+                ):
+                    for w in meaning:
+                        keys.update(self.roots.keys(w))
+            self.notion_keys[features.notion] = keys
+        return self.notion_keys[features.notion]
+
+    def size(self) -> int:
+        """Returns the number of processed knowledges."""
+        return len(self.processed)
+
+    def has_new(self) -> bool:
+        """Returns whether there is some newly processed knowledge."""
+        return self.start < len(self.processed)
+
+    def start_round(self, start: int) -> None:
+        """Every knowledge numbered below `start` becomes an old processed knowledge."""
+        self.start = start
+
+    def add(self, notion: str) -> None:
+        """Adds a newly processed knowledge to the index."""
+        kl_id = len(self.processed)
+        features = distance.notion_features(notion, self.lang)
+        self.processed.append(features)
+        for key in self.keys(features):
+            self.postings.setdefault(key, []).append(kl_id)
+        if len(features.words) <= self.alpha:
+            self.small.append(kl_id)
+
+    def candidates(
+        self, notion: str, start: int | None = None, stop: int | None = None
+    ) -> list[distance.NotionFeatures]:
+        """
+        Returns, in the order in which they were processed, the features of the newly
+        processed knowledges that might be at distance at most alpha from `notion`.
+        If `start` or `stop` are given, only knowledges whose number is in
+        [start, stop) are returned.
+        """
+        features = distance.notion_features(notion, self.lang)
+        start = self.start if start is None else max(start, self.start)
+        stop = len(self.processed) if stop is None else stop
+        ids: set[int] = set()
+        for key in self.keys(features):
+            posting = self.postings.get(key, [])
+            ids.update(
+                posting[
+                    bisect.bisect_left(posting, start) : bisect.bisect_left(
+                        posting, stop
+                    )
+                ]
+            )
+        if len(features.words) <= self.alpha:
+            ids.update(
+                self.small[
+                    bisect.bisect_left(self.small, start) : bisect.bisect_left(
+                        self.small, stop
+                    )
+                ]
+            )
+        return [self.processed[i] for i in sorted(ids)]
+
+
+def closest_notions(
+    features: distance.NotionFeatures,
+    candidates: list[distance.NotionFeatures],
+    prefixes: tuple[str, ...],
+    scopes_meaning: dict[str, list[list[str]]],
+    lang: str,
+    alpha: float,
+    dist_min: float | None = None,
+    kl2_min_list: list[str] | None = None,
+) -> tuple[float | None, list[str]]:
+    """
+    Returns the minimal distance between some notion and the candidates, together
+    with the list of candidates at this distance, in order, provided that this
+    distance is at most alpha. Otherwise, the distance returned is greater than alpha.
+    The search can be resumed from the result (dist_min, kl2_min_list) obtained
+    on previous candidates.
+    """
+    kl2_min_list = [] if kl2_min_list is None else kl2_min_list
+    for features2 in candidates:
+        # Distances greater than alpha, or than dist_min, need not be exact
+        bound = alpha if dist_min is None else min(alpha, dist_min)
+        d = distance.distance_features(
+            features, features2, prefixes, scopes_meaning, lang, bound
+        )
+        if dist_min is None or d < dist_min:
+            dist_min = d
+            kl2_min_list = [features2.notion]
+        elif d == dist_min:
+            kl2_min_list.append(features2.notion)
+    return dist_min, kl2_min_list
+
+
+# Read-only state of the worker processes, set once by init_worker
+WORKER_STATE: dict[str, Any] = {}
+
+
+def init_worker(
+    features: list[distance.NotionFeatures],
+    prefixes: tuple[str, ...],
+    scopes_meaning: dict[str, list[list[str]]],
+    lang: str,
+    alpha: float,
+) -> None:
+    """Initialises a worker process with the features of all notions."""
+    for f in features:
+        distance.add_notion_features(f, lang)
+    WORKER_STATE["prefixes"] = prefixes
+    WORKER_STATE["scopes_meaning"] = scopes_meaning
+    WORKER_STATE["lang"] = lang
+    WORKER_STATE["alpha"] = alpha
+
+
+def worker_closest_notions(
+    task: tuple[str, list[str]],
+) -> tuple[float | None, list[str]]:
+    """Calls closest_notions in a worker process on a notion and its candidates."""
+    notion, candidates = task
+    lang = WORKER_STATE["lang"]
+    return closest_notions(
+        distance.notion_features(notion, lang),
+        [distance.notion_features(kl, lang) for kl in candidates],
+        WORKER_STATE["prefixes"],
+        WORKER_STATE["scopes_meaning"],
+        lang,
+        WORKER_STATE["alpha"],
+    )
 
 
 def clustering(
@@ -86,6 +317,7 @@ def clustering(
     list_prefixes: list[str],
     scopes_meaning: dict[str, list[list[str]]],
     lang: str,
+    jobs: int = 1,
 ):
     """
     Adds all knowledges in unknown_kl to the structure kls.
@@ -109,33 +341,113 @@ def clustering(
         lang: a string describing the language of the document;
             a value from the dictionnary knowledge_clustering.app._NLTK_LANG;
             used to compute the distance.
+        jobs: the number of processes used to compute distances. If jobs > 1, at
+            the beginning of each round, the distances between the unknown knowledges
+            and the newly processed ones are computed in parallel; the result is the
+            same as with a single process.
     """
-    kl_processed_old = []
-    kl_processed_new = kls.get_all_knowledges()
+    prefixes = tuple(list_prefixes)
+    index = CandidateIndex(alpha, prefixes, scopes_meaning, lang)
+    with instr.stage("candidate index"):
+        for kl in kls.get_all_knowledges():
+            index.add(kl)
+    pool: ProcessPoolExecutor | None = None
+    if jobs > 1 and unknown_kl:
+        # The workers are spawned rather than forked, as forking while another
+        # thread runs (such as the check for updates) may deadlock the child
+        pool = ProcessPoolExecutor(
+            max_workers=jobs,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(
+                [
+                    distance.notion_features(kl, lang)
+                    for kl in set(kls.get_all_knowledges() + unknown_kl)
+                ],
+                prefixes,
+                scopes_meaning,
+                lang,
+                alpha,
+            ),
+        )
+    try:
+        with instr.stage("rounds"):
+            clustering_rounds(kls, unknown_kl, alpha, index, pool, jobs)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def clustering_rounds(
+    kls: KnowledgesList,
+    unknown_kl: list[str],
+    alpha: float,
+    index: CandidateIndex,
+    pool: ProcessPoolExecutor | None,
+    jobs: int,
+):
+    """
+    Rounds of the clustering algorithm, see clustering.
+    The distances between the unknown knowledges and the knowledges processed before
+    the beginning of a round are computed using `pool`, made of `jobs` processes,
+    if it is not None.
+    """
+    prefixes, scopes_meaning, lang = index.prefixes, index.scopes_meaning, index.lang
     while unknown_kl:
         # If there is no newly processed knowledge, pick an unknown knowledge
         # and add it to a new bag.
-        if not kl_processed_new:
+        if not index.has_new():
             kl = unknown_kl[0]
             unknown_kl = unknown_kl[1:]
             kls.add_new_bag(kl)
-            kl_processed_new = [kl]
-        size_kl_processed_new = len(kl_processed_new)
+            index.add(kl)
+        end_of_round = index.size()
         # Tries to add every unknown knowledge to a bag
         unknown_kl_copy = copy.copy(unknown_kl)
-        for kl in unknown_kl_copy:
-            dist_min = None
-            kl2_min_list = []
-            # Finds the processed notion that is at a minimal distance from kl
-            for kl2 in kl_processed_new:
-                d = distance.distance(
-                    kl, kl2, tuple(list_prefixes), scopes_meaning, lang
+        partial_results: list[tuple[float | None, list[str]]] | None = None
+        if pool is not None:
+            # Distances to the knowledges processed before this round,
+            # computed in parallel
+            tasks = [
+                (kl, [f.notion for f in index.candidates(kl, stop=end_of_round)])
+                for kl in unknown_kl_copy
+            ]
+            instr.count("distance computations", sum(len(c) for _, c in tasks))
+            partial_results = list(
+                pool.map(
+                    worker_closest_notions,
+                    tasks,
+                    chunksize=max(1, len(tasks) // (4 * jobs)),
+                )
+            )
+        for i, kl in enumerate(unknown_kl_copy):
+            # Finds the processed notion that is at a minimal distance from kl,
+            # among those that can possibly be at distance at most alpha
+            features = distance.notion_features(kl, lang)
+            if partial_results is None:
+                candidates = index.candidates(kl)
+                instr.count("distance computations", len(candidates))
+                dist_min, kl2_min_list = closest_notions(
+                    features,
+                    candidates,
+                    prefixes,
+                    scopes_meaning,
+                    lang,
+                    alpha,
+                )
+            else:
+                # Knowledges processed during this round are handled sequentially
+                candidates = index.candidates(kl, start=end_of_round)
+                instr.count("distance computations", len(candidates))
+                dist_min, kl2_min_list = closest_notions(
+                    features,
+                    candidates,
+                    prefixes,
+                    scopes_meaning,
+                    lang,
+                    alpha,
+                    *partial_results[i],
                 )
-                if dist_min is None or d < dist_min:
-                    dist_min = d
-                    kl2_min_list = [kl2]
-                elif d == dist_min:
-                    kl2_min_list.append(kl2)
             # If this minimal distance is smaller than the threshold alpha, add kl to the bag
             if dist_min is not None and dist_min <= alpha:
                 # Choose kl2_min in kl2_min_list minimising the edit distance
@@ -143,8 +455,8 @@ def clustering(
                 # Add kl to the bag of kl2_min
                 kls.define_synonym_of(kl, kl2_min)
                 unknown_kl.remove(kl)
-                kl_processed_new.append(kl)
+                index.add(kl)
         # Every "new processed knowledge" that was known at the beginning of the while iteration
         # becomes an "old processed knowledge"
-        kl_processed_old += kl_processed_new[:size_kl_processed_new]
-        kl_processed_new = kl_processed_new[size_kl_processed_new:]
+        index.start_round(end_of_round)
+        instr.count("rounds")
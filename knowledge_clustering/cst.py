@@ -5,19 +5,14 @@ Constants used throughout knowledge-clustering.
 from __future__ import annotations  # Support of `|` for type union in Python 3.9
 
 from pathlib import Path
-from importlib import resources
+from typing import Any
 
 ALPHA = 0
 
 CONFIG_FILENAME: dict[str, str] = {"en": "english.ini", "fr": "french.ini"}
-ref = resources.files("knowledge_clustering") / "data"
-with resources.as_file(ref) as path:
-    CONFIG_DIR: Path = path
-CONFIG_FILE: dict[str, Path] = dict()
-for lan, filename in CONFIG_FILENAME.items():
-    ref_file = resources.files("knowledge_clustering") / f"data/{filename}"
-    with resources.as_file(ref_file) as path_file:
-        CONFIG_FILE[lan] = path_file
+# Resolved on first access, see __getattr__
+CONFIG_DIR: Path
+CONFIG_FILE: dict[str, Path]
 NLTK_LANG: dict[str, str] = {"en": "english", "fr": "french"}
 
 INTRO_DELIMITERS: list[tuple[str, str]] = [
@@ -85,7 +80,50 @@ SPACE_CHAR = ["~", "\\\\"]
 
 DISCARD_LINE = "%%%%% NEW KNOWLEDGES "
 
+NLP_CACHE_FILENAME = ".knowledge-clustering.cache"
+ADDQUOTES_POLICIES: dict[str, tuple[str, ...]] = {
+    # Questions of the addquotes command answered positively in batch mode:
+    # "quote" adds quotes around a knowledge, and "synonym" defines a new synonym
+    # of a knowledge and adds quotes around it
+    "exact": ("quote",),
+    "all": ("quote", "synonym"),
+}
+CACHE_MAXSIZE: int = (
+    65536  # Default maximal number of entries of each in-memory cache
+    # of the distance module
+)
+
 TIMEOUT_REQUEST: float = (
     0.25  # Timeout to resquest the latest version
     # of knowledge-clustering (in seconds)
 )
+TIMEOUT_UPDATE_CHECK: float = (
+    1.0  # Maximal time waited at the end of a command for the
+    # latest version of knowledge-clustering (in seconds)
+)
+UPDATE_CACHE_FILENAME = "latest-version.json"
+UPDATE_CACHE_TTL: float = (
+    86400.0  # Duration during which the latest version of
+    # knowledge-clustering found on PyPI is cached (in seconds)
+)
+
+
+def __getattr__(name: str) -> Any:
+    """
+    Resolves CONFIG_DIR and CONFIG_FILE on first access, so that commands that do
+    not need the configuration files don't pay for importlib.resources.
+    """
+    if name not in {"CONFIG_DIR", "CONFIG_FILE"}:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from importlib import resources  # pylint: disable=import-outside-toplevel
+
+    ref = resources.files("knowledge_clustering") / "data"
+    with resources.as_file(ref) as path:
+        globals()["CONFIG_DIR"] = path
+    config_file: dict[str, Path] = dict()
+    for lan, filename in CONFIG_FILENAME.items():
+        ref_file = resources.files("knowledge_clustering") / f"data/{filename}"
+        with resources.as_file(ref_file) as path_file:
+            config_file[lan] = path_file
+    globals()["CONFIG_FILE"] = config_file
+    return globals()[name]
@@ -4,9 +4,30 @@ Functions for handling the .diagnose files.
 
 from __future__ import annotations  # Support of `|` for type union in Python 3.9
 
-from typing import Callable, Generator
+from typing import Callable, Generator, Iterable, NamedTuple, TypeVar
+import re
+
 from knowledge_clustering import cst
 
+State = TypeVar("State")
+Output = TypeVar("Output")
+
+LOCATION_REGEX = re.compile(r"^%\s*(.+):(\d+)\s*$")
+
+
+class Location(NamedTuple):
+    """Position of a knowledge in the TeX sources, as given by a diagnose file."""
+
+    filename: str
+    line: int
+
+
+class DiagnoseEntry(NamedTuple):
+    """Knowledge of a diagnose file, together with the position preceding it."""
+
+    notion: str
+    location: Location | None
+
 
 def automata_line(state: int, line: str) -> tuple[int, str | None]:
     """
@@ -36,19 +57,102 @@ def automata_line(state: int, line: str) -> tuple[int, str | None]:
     return state, None
 
 
+def parse_location(line: str) -> Location | None:
+    """
+    Parses a line of the form `% file.tex:line`, which precedes knowledges in
+    diagnose files compiled with the option `diagnose line=true`.
+    """
+    m = LOCATION_REGEX.match(line.strip())
+    if m is None:
+        return None
+    return Location(m.group(1), int(m.group(2)))
+
+
+def automata_line_location(
+    state: tuple[int, Location | None], line: str
+) -> tuple[tuple[int, Location | None], DiagnoseEntry | None]:
+    """
+    Transition function of a transducers parsing knowledges from a diagnose file,
+    together with their location, which is read line by line.
+
+    Args:
+            state: a pair (q, location) where q is a state of automata_line, and
+                    location is the last location read in the current knowledge block.
+            line: a line of the .diagnose document.
+
+    Returns:
+            a pair (state, entry) where state is the new state of the automaton,
+            and entry is either None, or a knowledge parsed while reading the line
+            given as input together with its location.
+    """
+    q, location = state
+    q, kl = automata_line(q, line)
+    if kl is not None:
+        return (q, location), DiagnoseEntry(kl, location)
+    if q != 2:
+        return (q, None), None
+    return (q, parse_location(line) or location), None
+
+
 def unroll(
-    automata: Callable[[int, str], tuple[int, str | None]],
-    initial_state: int,
-    str_input: list[str],
-) -> Generator[str | None, None, None]:
+    automata: Callable[[State, str], tuple[State, Output]],
+    initial_state: State,
+    str_input: Iterable[str],
+) -> Generator[Output, None, None]:
     """Builds a generator object from the transition function of a transducer."""
-    state: int = initial_state
-    z: str | None
+    state: State = initial_state
+    z: Output
     for y in str_input:
         state, z = automata(state, y)
         yield z
 
 
+def iter_entries(filename: str) -> Generator[DiagnoseEntry, None, None]:
+    """
+    Reads a diagnose file lazily, and yields every occurrence of a knowledge in it,
+    together with its location.
+
+    Args:
+            filename: the name of the .diagnose file.
+    """
+    initial: tuple[int, Location | None] = (0, None)
+    with open(filename, encoding="utf-8") as f:
+        for entry in unroll(automata_line_location, initial, f):
+            if entry is not None:
+                yield entry
+
+
+def iter_notions(filename: str) -> Generator[str, None, None]:
+    """
+    Reads a diagnose file lazily, and yields the knowledges it contains,
+    without duplicates, in order of first occurrence.
+
+    Args:
+            filename: the name of the .diagnose file.
+    """
+    seen: set[str] = set()
+    for notion, _ in iter_entries(filename):
+        if notion not in seen:
+            seen.add(notion)
+            yield notion
+
+
+def locations(filename: str) -> dict[str, list[Location]]:
+    """
+    Parses a diagnose file and returns the knowledges it contains, in order of
+    first occurrence, each with the list of its locations.
+
+    Args:
+            filename: the name of the .diagnose file.
+    """
+    result: dict[str, list[Location]] = {}
+    for notion, location in iter_entries(filename):
+        result.setdefault(notion, [])
+        if location is not None:
+            result[notion].append(location)
+    return result
+
+
 def parse(filename: str) -> list[str]:
     """
     Parses a diagnose file and returns the knowledges it contains.
@@ -59,9 +163,4 @@ def parse(filename: str) -> list[str]:
     Returns:
             a list of knowledges.
     """
-    with open(filename, encoding="utf-8") as f:
-        list_notions = []
-        for notion in unroll(automata_line, 0, f.readlines()):
-            if notion is not None and notion not in list_notions:
-                list_notions.append(notion)
-    return list(list_notions)
+    return list(iter_notions(filename))
@@ -2,15 +2,176 @@
 
 from __future__ import annotations  # Support of `|` for type union in Python 3.9
 
+from collections import OrderedDict
+from typing import Any, Callable, NamedTuple, TypeVar
+
 import copy
+import functools
+import re
 import nltk  # type: ignore
 import nltk.stem.snowball as nss  # type: ignore
 from unidecode import unidecode
 from functools import cache
 
 from knowledge_clustering import cst
+from knowledge_clustering import instrumentation as instr
 from knowledge_clustering.misc import emph
 
+F = TypeVar("F", bound=Callable[..., Any])
+
+# ---
+# Caches
+# ---
+
+
+class CacheInfo(NamedTuple):
+    """Statistics of a cache."""
+
+    hits: int
+    misses: int
+    maxsize: int | None
+    currsize: int
+
+
+class LRUCache:
+    """
+    Cache containing at most `maxsize` entries (or unbounded if `maxsize` is None),
+    evicting the least recently used entry when full, and counting hits and misses.
+    """
+
+    def __init__(self, maxsize: int | None = cst.CACHE_MAXSIZE):
+        self.maxsize: int | None = maxsize
+        self.data: OrderedDict[Any, Any] = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """Returns the value associated to some key, or `default` if there is none."""
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.data.move_to_end(key)
+        return value
+
+    def put(self, key: Any, value: Any) -> None:
+        """Associates some value to a key, evicting old entries if needed."""
+        self.data[key] = value
+        self.data.move_to_end(key)
+        self.__evict()
+
+    def resize(self, maxsize: int | None) -> None:
+        """Changes the maximal number of entries."""
+        self.maxsize = maxsize
+        self.__evict()
+
+    def __evict(self) -> None:
+        if self.maxsize is not None:
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self.data
+
+    def __delitem__(self, key: Any) -> None:
+        del self.data[key]
+
+    def clear(self) -> None:
+        """Removes all entries and resets the counters."""
+        self.data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self) -> CacheInfo:
+        """Returns the statistics of the cache."""
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.data))
+
+
+class CachedFunction:
+    """
+    Function memoized by functools.lru_cache, whose maximal size can be changed.
+    """
+
+    def __init__(self, function: Callable[..., Any], maxsize: int | None):
+        functools.update_wrapper(self, function)
+        self.function: Callable[..., Any] = function
+        self.resize(maxsize)
+
+    def __call__(self, *args):
+        return self.memoized(*args)
+
+    def resize(self, maxsize: int | None) -> None:
+        """Changes the maximal number of entries, emptying the cache."""
+        self.memoized = functools.lru_cache(maxsize)(self.function)
+
+    def clear(self) -> None:
+        """Removes all entries and resets the counters."""
+        self.memoized.cache_clear()
+
+    def info(self) -> CacheInfo:
+        """Returns the statistics of the cache."""
+        return CacheInfo(*self.memoized.cache_info())
+
+
+# Registry of the caches of this module, by name
+CACHES: dict[str, LRUCache | CachedFunction] = {}
+
+
+def register_cache(name: str, maxsize: int | None = cst.CACHE_MAXSIZE) -> LRUCache:
+    """Creates a cache and adds it to the registry."""
+    lru = LRUCache(maxsize)
+    CACHES[name] = lru
+    return lru
+
+
+def cached(name: str, maxsize: int | None = cst.CACHE_MAXSIZE) -> Callable[[F], F]:
+    """
+    Decorator memoizing a function with hashable arguments, whose cache is added to
+    the registry.
+    """
+
+    def decorator(f: F) -> F:
+        cached_f = CachedFunction(f, maxsize)
+        CACHES[name] = cached_f
+        return cached_f  # type: ignore
+
+    return decorator
+
+
+def set_cache_size(maxsize: int | None, name: str | None = None) -> None:
+    """
+    Sets the maximal number of entries of some cache, or of all caches if `name`
+    is None.
+    """
+    for cache_name, lru in CACHES.items():
+        if name is None or cache_name == name:
+            lru.resize(maxsize)
+
+
+def clear_caches() -> None:
+    """Empties all caches, e.g. between two documents."""
+    for lru in CACHES.values():
+        lru.clear()
+
+
+def cache_stats() -> dict[str, CacheInfo]:
+    """Returns the statistics of all caches."""
+    return {name: lru.info() for name, lru in CACHES.items()}
+
+
+def print_cache_stats() -> None:
+    """Prints the statistics of all caches."""
+    print("Cache statistics:")
+    for name, info in cache_stats().items():
+        maxsize = "∞" if info.maxsize is None else info.maxsize
+        print(
+            f"\t{name}: {info.hits} hits, {info.misses} misses, "
+            + f"{info.currsize}/{maxsize} entries"
+        )
+
+
 # ---
 # Edit distance
 # ---
@@ -21,23 +182,49 @@ def levenshtein_distance(s: str, t: str) -> int:
     Computes the Levenshtein (insertions, deletions or substitutions are allowed)
     edit distance between two strings.
     """
-    # Implementation of the Wagner–Fischer algorithm
-    # https://en.wikipedia.org/wiki/Wagner%E2%80%93Fischer_algorithm
+    return bounded_levenshtein_distance(s, t, max(len(s), len(t)))
+
+
+def bounded_levenshtein_distance(s: str, t: str, bound: int) -> int:
+    """
+    Computes the Levenshtein edit distance between two strings if it is at most
+    `bound`, and returns some integer greater than `bound` otherwise.
+    """
+    # Bit-parallel algorithm of Myers, in the formulation of Hyyrö
+    # https://doi.org/10.1145/316542.316550
+    # The i-th bit of pv (resp. mv) is set if the vertical difference
+    # dist[i+1][j] - dist[i][j] in the Wagner–Fischer matrix is +1 (resp. -1).
+    # Python integers being unbounded, there is no restriction on the length of s.
     m, n = len(s), len(t)
-    dist = [[0 for _ in range(n + 1)] for _ in range(m + 1)]
-    for i in range(1, m + 1):
-        dist[i][0] = i
-    for j in range(1, n + 1):
-        dist[0][j] = j
-    for j in range(1, n + 1):
-        for i in range(1, m + 1):
-            substitution_cost = 0 if s[i - 1] == t[j - 1] else 1
-            dist[i][j] = min(
-                dist[i - 1][j] + 1,
-                dist[i][j - 1] + 1,
-                dist[i - 1][j - 1] + substitution_cost,
-            )
-    return dist[m][n]
+    if abs(m - n) > bound:
+        return bound + 1
+    if m == 0:
+        return n
+    peq: dict[str, int] = {}
+    for i, c in enumerate(s):
+        peq[c] = peq.get(c, 0) | (1 << i)
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv, mv = full, 0
+    score = m
+    for j, c in enumerate(t):
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & full
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        # The score changes by at most one for every remaining letter of t
+        if score - (n - j - 1) > bound:
+            return bound + 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv
+    return score
 
 
 def minimise_levenshtein_distance(s: str, t_list: list[str]) -> str:
@@ -48,7 +235,10 @@ def minimise_levenshtein_distance(s: str, t_list: list[str]) -> str:
     t_min = t_list[0]
     dist_min = levenshtein_distance(s, t_min)
     for t in t_list[1:]:
-        dist = levenshtein_distance(s, t)
+        if dist_min == 0:
+            break
+        # Only distances smaller than dist_min need to be computed exactly
+        dist = bounded_levenshtein_distance(s, t, dist_min - 1)
         if dist < dist_min:
             t_min = t
             dist_min = dist
@@ -71,52 +261,67 @@ def extract_scope(notion: str) -> tuple[str, str]:
     return notion, ""
 
 
-def normalise_notion(notion: str) -> str:
+MATH_REGEX = re.compile(r"\$[^$]*\$?")
+
+
+def remove_commands(notion: str) -> str:
+    """Removes every backslash, together with the letters following it."""
+    # see https://tex.stackexchange.com/a/34381/206008 for naming conventions of TeX commands
+    parts: list[str] = []
+    pos = 0
+    i = notion.find("\\")
+    while i != -1:
+        parts.append(notion[pos:i])
+        i += 1
+        while i < len(notion) and notion[i].isalpha():
+            i += 1
+        pos = i
+        i = notion.find("\\", pos)
+    parts.append(notion[pos:])
+    return "".join(parts)
+
+
+def normalise_tex(notion: str) -> str:
     """
-    Returns the substring of a notion obtained by removing math, commands, accents
+    Returns the substring of a notion obtained by removing math, commands
     and non-brekable spaces.
     """
-    notion_norm = notion.lower()  # to lowercase
-    while "$" in notion_norm:
-        sp = notion_norm.split("$", 2)
-        if len(sp) <= 1:
-            break
-        notion_norm = sp[0] + sp[2]
-    for remove_char in cst.IGNORE_CHAR_BACKSLASH:
-        while remove_char in notion_norm:
-            # If the notion contains remove_char, remove it.
-            sp = notion_norm.split(remove_char, 1)
-            notion_norm = sp[0] + sp[1]
+    notion_norm = notion.lower()
+    if "$" in notion_norm:
+        # An unmatched `$` starts math that extends to the end of the notion.
+        notion_norm = MATH_REGEX.sub("", notion_norm)
+    if "\\" in notion_norm:
+        for remove_char in cst.IGNORE_CHAR_BACKSLASH:
+            # Removing an occurrence can create a new one, e.g. in `\\``.
+            while remove_char in notion_norm:
+                notion_norm = notion_norm.replace(remove_char, "")
     for space_char in cst.SPACE_CHAR:
-        while space_char in notion_norm:
-            # If the notion contains remove_char, replace it with a space.
-            sp = notion_norm.split(space_char, 1)
-            notion_norm = sp[0] + " " + sp[1]
-    while "\\" in notion_norm:
-        # If the notion contains a backslash, remove every letter following the backslash
-        # see https://tex.stackexchange.com/a/34381/206008 for naming conventions of TeX commands
-        sp = notion_norm.split("\\", 1)
-        pref, suff = sp[0], sp[1]
-        i = 0
-        while i < len(suff) and suff[i].isalpha():
-            i += 1
-        notion_norm = pref + suff[i:]
+        notion_norm = notion_norm.replace(space_char, " ")
+    if "\\" in notion_norm:
+        notion_norm = remove_commands(notion_norm)
     for remove_char in cst.IGNORE_CHAR_NO_BACKSLASH:
-        while remove_char in notion_norm:
-            # If the notion contains remove_char, remove it.
-            sp = notion_norm.split(remove_char, 1)
-            notion_norm = sp[0] + sp[1]
-    return unidecode(notion_norm)  # Ascii-fy (in particular, remove accents) the result
+        notion_norm = notion_norm.replace(remove_char, "")
+    return notion_norm
 
 
-@cache
+def normalise_notion(notion: str) -> str:
+    """
+    Returns the substring of a notion obtained by removing math, commands, accents
+    and non-brekable spaces.
+    """
+    return unidecode(normalise_tex(notion))  # Ascii-fy (in particular, remove accents)
+
+
+@cached("tokenize")
 def cached_tokenize(word: str, lang: str) -> list[str]:
-    return nltk.word_tokenize(word, language=lang)
+    with instr.stage("NLTK tokenization"):
+        return nltk.word_tokenize(word, language=lang)
 
 
-@cache
+@cached("POS tags")
 def cached_POStag(tokens: tuple[str, ...]) -> list:
-    return nltk.pos_tag(list(tokens))
+    with instr.stage("NLTK tagging"):
+        return nltk.pos_tag(list(tokens))
 
 
 def breakup_notion(notion: str, lang: str) -> tuple[list[str], str]:
@@ -146,54 +351,189 @@ def breakup_notion(notion: str, lang: str) -> tuple[list[str], str]:
         ) from e
 
 
+class NotionFeatures:
+    """
+    Features of a notion that are relevant to compute distances: its normalised form,
+    its scope, its important words and their stems.
+    Computed once per notion by `notion_features`, and should not be modified.
+    """
+
+    __slots__ = ("notion", "normalised", "scope", "words", "stems")
+
+    def __init__(
+        self,
+        notion: str,
+        normalised: str,
+        scope: str,
+        words: tuple[str, ...],
+        stems: tuple[str, ...],
+    ):
+        self.notion: str = notion
+        self.normalised: str = normalised
+        self.scope: str = scope
+        self.words: tuple[str, ...] = words
+        self.stems: tuple[str, ...] = stems
+
+
+FEATURES: LRUCache = register_cache("features")
+
+
+def notion_features(notion: str, lang: str) -> NotionFeatures:
+    """Returns the features of a notion."""
+    features = FEATURES.get((notion, lang))
+    if features is None:
+        words, scope = breakup_notion(notion, lang)
+        features = NotionFeatures(
+            notion,
+            normalise_notion(notion),
+            scope,
+            tuple(words),
+            tuple(cached_stem(w, lang) for w in words),
+        )
+        FEATURES.put((notion, lang), features)
+    return features
+
+
+def add_notion_features(features: NotionFeatures, lang: str) -> None:
+    """Registers the features of a notion, e.g. loaded from the NLP cache."""
+    FEATURES.put((features.notion, lang), features)
+
+
 # ---
 # Computing the distance between two notions
 # ---
 
 
-@cache
+class RootIndex:
+    """
+    Canonical forms of words, for a given list of prefixes to ignore.
+
+    The forms of a word are the word itself and its stem. Its roots are the strings
+    obtained from its forms by removing a prefix in `prefixes` and a suffix in
+    cst.IGNORE_SUFFIXES. Two distinct words are similar iff some form of one of them is
+    a root of the other one. The forms and roots of each word are computed once by
+    cached_forms_and_roots, which identifies the index by its number.
+    """
+
+    def __init__(self, prefixes: tuple[str, ...], lang: str):
+        self.prefixes: tuple[str, ...] = prefixes
+        self.lang: str = lang
+        self.number: int = len(ROOT_INDEXES)
+
+    def forms_and_roots(self, word: str) -> tuple[frozenset[str], frozenset[str]]:
+        """Returns the forms and the roots of a word."""
+        return cached_forms_and_roots(self.number, word)
+
+    def word_forms(self, word: str) -> frozenset[str]:
+        """Returns the word and its stem."""
+        return self.forms_and_roots(word)[0]
+
+    def word_roots(self, word: str) -> frozenset[str]:
+        """Returns the roots of a word."""
+        return self.forms_and_roots(word)[1]
+
+    def keys(self, word: str) -> frozenset[str]:
+        """
+        Returns the forms and roots of a word. Two similar words always share a key.
+        """
+        forms, roots = self.forms_and_roots(word)
+        return forms | roots
+
+    def similar(self, w1: str, w2: str) -> bool:
+        """See similar_words."""
+        if w1 == w2:
+            return True
+        forms1, roots1 = self.forms_and_roots(w1)
+        forms2, roots2 = self.forms_and_roots(w2)
+        return not forms1.isdisjoint(roots2) or not forms2.isdisjoint(roots1)
+
+
+ROOT_INDEXES: list[RootIndex] = []
+ROOT_INDEX_NUMBERS: dict[tuple[tuple[str, ...], str], int] = {}
+
+
+def root_index(prefixes: tuple[str, ...], lang: str) -> RootIndex:
+    """Returns the index of canonical forms of words for some prefixes and language."""
+    if (prefixes, lang) not in ROOT_INDEX_NUMBERS:
+        ROOT_INDEX_NUMBERS[(prefixes, lang)] = len(ROOT_INDEXES)
+        ROOT_INDEXES.append(RootIndex(prefixes, lang))
+    return ROOT_INDEXES[ROOT_INDEX_NUMBERS[(prefixes, lang)]]
+
+
+@cached("roots")
+def cached_forms_and_roots(
+    index_number: int, word: str
+) -> tuple[frozenset[str], frozenset[str]]:
+    """Returns the forms and roots of a word, see RootIndex."""
+    index = ROOT_INDEXES[index_number]
+    forms = frozenset({word, cached_stem(word, index.lang)})
+    roots: set[str] = set()
+    for s in forms:
+        for p in index.prefixes:
+            if s.startswith(p):
+                for suffix in cst.IGNORE_SUFFIXES:
+                    if len(p) + len(suffix) <= len(s) and s.endswith(suffix):
+                        roots.add(s[len(p) : len(s) - len(suffix)])
+    return forms, frozenset(roots)
+
+
 def similar_words(w1: str, w2: str, prefixes: tuple[str, ...], lang: str) -> bool:
     """
     Checks if two words w1 and w2 are similar up to taking their stem (removing a suffix)
     and removing a prefix in the list `prefixes`.
     """
-
-    def asymmetric_similar(s1: str, s2: str) -> bool:
-        if s1 in s2:
-            for p in prefixes:
-                if s2.startswith(p):
-                    for s in cst.IGNORE_SUFFIXES:
-                        if p + s1 + s == s2:
-                            return True
-        return False
-
-    if w1 == w2:
-        return True
-    for s1 in [w1, cached_stem(w1, lang)]:
-        for s2 in [w2, cached_stem(w2, lang)]:
-            if asymmetric_similar(s1, s2) or asymmetric_similar(s2, s1):
-                return True
-    return False
+    return root_index(prefixes, lang).similar(w1, w2)
 
 
 def __semi_distance_sets_of_words(
-    set_words1: list[str], set_words2: list[str], prefixes: tuple[str, ...], lang: str
+    set_words1: list[str],
+    set_words2: list[str],
+    prefixes: tuple[str, ...],
+    lang: str,
+    bound: float | None = None,
 ) -> tuple[int, int]:
     """
     Given two sets of words (considered up to permutation), computes the
     numbers of words of w1 that aren't close to a word of w2 and reciprocally.
+
+    Words of w1 are greedily matched, in order, with the first similar word of w2 that
+    is not matched yet. Matched words are removed from both lists.
+    If bound is given and the sum of both numbers is known to be greater than bound,
+    the matching stops early: both lists are then only partially updated, and the
+    numbers returned are lower bounds whose sum is greater than bound.
     """
-    for w1 in set_words1:
-        similar_to_w1 = [
-            w2 for w2 in set_words2 if similar_words(w1, w2, prefixes, lang)
-        ]
-        # If you find a pair of similar words, remove them.
-        if len(similar_to_w1) > 0:
-            w2 = similar_to_w1[0]
-            set_words1.remove(w1)
-            set_words2.remove(w2)
-            return __semi_distance_sets_of_words(set_words1, set_words2, prefixes, lang)
-    return (len(set_words1), len(set_words2))
+    number = root_index(prefixes, lang).number
+    entries2 = [cached_forms_and_roots(number, w2) for w2 in set_words2]
+    remaining2: list[int] = list(range(len(set_words2)))
+    matched1: set[int] = set()
+    for i, w1 in enumerate(set_words1):
+        forms1, roots1 = cached_forms_and_roots(number, w1)
+        # Finds the first word of w2 that is similar to w1 and not matched yet,
+        # see RootIndex.similar
+        for k, j in enumerate(remaining2):
+            forms2, roots2 = entries2[j]
+            if (
+                w1 == set_words2[j]
+                or not forms1.isdisjoint(roots2)
+                or not forms2.isdisjoint(roots1)
+            ):
+                matched1.add(i)
+                del remaining2[k]
+                break
+        if bound is not None:
+            # Words that remain in w1 can match at most len(remaining2) words of w2
+            left1 = len(set_words1) - i - 1
+            d1 = i + 1 - len(matched1) + max(0, left1 - len(remaining2))
+            d2 = max(0, len(remaining2) - left1)
+            if d1 + d2 > bound:
+                break
+    else:
+        d1 = len(set_words1) - len(matched1)
+        d2 = len(remaining2)
+    # Removes the matched words
+    set_words1[:] = [w for i, w in enumerate(set_words1) if i not in matched1]
+    set_words2[:] = [set_words2[j] for j in remaining2]
+    return (d1, d2)
 
 
 def inclusion_sets_of_words(
@@ -208,12 +548,20 @@ def inclusion_sets_of_words(
 
 
 def distance_sets_of_words(
-    set_words1: list[str], set_words2: list[str], prefixes: tuple[str, ...], lang: str
+    set_words1: list[str],
+    set_words2: list[str],
+    prefixes: tuple[str, ...],
+    lang: str,
+    bound: float | None = None,
 ) -> int:
     """
     Given two sets of words (considered up to permutation), computes the distance between them.
+    If bound is given and the distance is greater than bound, some value greater than
+    bound is returned.
     """
-    d1, d2 = __semi_distance_sets_of_words(set_words1, set_words2, prefixes, lang)
+    d1, d2 = __semi_distance_sets_of_words(
+        set_words1, set_words2, prefixes, lang, bound
+    )
     return d1 + d2
 
 
@@ -223,7 +571,7 @@ def new_stemmer(lang: str):
     return nss.SnowballStemmer(lang)
 
 
-@cache
+@cached("stems")
 def cached_stem(word: str, lang: str):
     return new_stemmer(lang).stem(word)
 
@@ -249,8 +597,31 @@ def distance(
     Returns:
         The distance between notion1 and notion2.
     """
-    kl1_words, sc1 = breakup_notion(notion1, lang)
-    kl2_words, sc2 = breakup_notion(notion2, lang)
+    return distance_features(
+        notion_features(notion1, lang),
+        notion_features(notion2, lang),
+        prefixes,
+        scopes_meaning,
+        lang,
+    )
+
+
+def distance_features(
+    features1: NotionFeatures,
+    features2: NotionFeatures,
+    prefixes: tuple[str, ...],
+    scopes_meaning: dict[str, list[list[str]]],
+    lang: str,
+    bound: float | None = None,
+) -> int:
+    """
+    Measures the distance between two notions given by their features,
+    see `distance`.
+    If bound is given and the distance is greater than bound, some value greater than
+    bound is returned.
+    """
+    kl1_words, sc1 = list(features1.words), features1.scope
+    kl2_words, sc2 = list(features2.words), features2.scope
     if sc1 != "" and sc2 != "" and sc1 != sc2:
         return cst.INFINITY
     if len(kl1_words) == 0 and len(kl2_words) == 0:
@@ -260,7 +631,7 @@ def distance(
         # Can happen if the notion is a command
         return cst.INFINITY
     if sc1 == sc2:
-        return distance_sets_of_words(kl1_words, kl2_words, prefixes, lang)
+        return distance_sets_of_words(kl1_words, kl2_words, prefixes, lang, bound)
     if sc1 == "":
         kl1_words, sc1, kl2_words, sc2 = kl2_words, sc2, kl1_words, sc1
     # sc2 is empty and sc1 isn't
@@ -270,11 +641,19 @@ def distance(
         sc1_meaning = scopes_meaning[sc1]
     else:
         sc1_meaning = [[sc1]]
-    for meaning in sc1_meaning:
+    for m_id, meaning in enumerate(sc1_meaning):
         kl1_with_meaning = list(copy.copy(kl1_words))
         kl1_with_meaning.extend([w for w in meaning if w not in kl1_with_meaning])
+        # kl2_words is modified by distance_sets_of_words, and reused for the next
+        # meanings: the computation can only stop early for the last one
         dist = min(
             dist,
-            distance_sets_of_words(kl1_with_meaning, kl2_words, prefixes, lang),
+            distance_sets_of_words(
+                kl1_with_meaning,
+                kl2_words,
+                prefixes,
+                lang,
+                bound if m_id == len(sc1_meaning) - 1 else None,
+            ),
         )
     return dist
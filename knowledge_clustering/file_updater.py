@@ -58,6 +58,11 @@ erase anyway?",
         return self.tmp
 
     def __exit__(self, typ, value, traceback):
+        if typ is not None:
+            # The content written may be incomplete: the file is left unchanged
+            self.ctx.__exit__(typ, value, traceback)
+            Path(self.ctx.name).unlink(missing_ok=True)
+            return None
         new_hash = hash_file(self.filename)
         if self.tmp is not None:
             if new_hash.hexdigest() != self.hash.hexdigest():
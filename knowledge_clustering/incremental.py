@@ -0,0 +1,187 @@
+"""
+State of the clustering algorithm persisted between runs, for the incremental mode.
+
+The state is stored in the same SQLite database as the NLP cache. It records, for
+every knowledge file, its hash after the last run and the knowledges that were
+added to it, each with the knowledge it was defined as a synonym of, together
+with the inferred meaning of scopes.
+Knowledges that are still undefined are added back to the same bags, and only
+the remaining ones are clustered.
+A knowledge file whose hash differs from the recorded one was modified by the user:
+the knowledges that were added to it are forgotten, and thus clustered again if
+they are still undefined.
+"""
+
+from __future__ import annotations  # Support of `|` for type union in Python 3.9
+
+from pathlib import Path
+from typing import NamedTuple
+
+import json
+import sqlite3
+
+import knowledge_clustering.file_updater as fu
+from knowledge_clustering import nlp_cache
+from knowledge_clustering.knowledges import KnowledgesList
+
+
+class State(NamedTuple):
+    """State of the clustering algorithm at the end of the previous run."""
+
+    # Knowledges added to each unchanged file, each with the knowledge it is a
+    # synonym of, or "" if it was added in a new bag
+    placed: dict[str, list[tuple[str, str]]]
+    scopes_meaning: dict[str, list[list[str]]] | None  # None if some file changed
+
+
+def connect(path: Path) -> sqlite3.Connection:
+    """Opens the cache, creating the tables storing the state if needed."""
+    db = nlp_cache.connect(path)
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS files (filename TEXT PRIMARY KEY, hash TEXT)"
+    )
+    db.execute("CREATE TABLE IF NOT EXISTS placed (filename TEXT, position INTEGER, \
+notion TEXT, anchor TEXT)")
+    db.execute("CREATE TABLE IF NOT EXISTS scopes (lang TEXT PRIMARY KEY, key TEXT, \
+meaning TEXT)")
+    return db
+
+
+def file_key(filename: str) -> str:
+    """Returns the key identifying a knowledge file in the cache."""
+    return str(Path(filename).resolve())
+
+
+def scopes_key(kls: KnowledgesList, hashes: dict[str, str]) -> str:
+    """Returns the key identifying the content of all knowledge files."""
+    return json.dumps(
+        [
+            (file_key(kl.filename), hashes[kl.filename])
+            for kl in kls.get_all_kls_struct()
+        ]
+    )
+
+
+def load(path: Path, kls: KnowledgesList, lang: str) -> State:
+    """
+    Returns the state stored in the cache that is still valid for the given
+    knowledge files, as they were when read.
+    """
+    hashes = {
+        kl.filename: kl.original_hash.hexdigest() for kl in kls.get_all_kls_struct()
+    }
+    placed: dict[str, list[tuple[str, str]]] = {}
+    scopes_meaning = None
+    if not path.exists():
+        return State(placed, scopes_meaning)
+    try:
+        db = connect(path)
+        for fn, h in hashes.items():
+            row = db.execute(
+                "SELECT hash FROM files WHERE filename = ?", (file_key(fn),)
+            ).fetchone()
+            if row is not None and row[0] == h:
+                rows = db.execute(
+                    "SELECT notion, anchor FROM placed WHERE filename = ? \
+ORDER BY position",
+                    (file_key(fn),),
+                ).fetchall()
+                placed[fn] = list(rows)
+        row = db.execute(
+            "SELECT key, meaning FROM scopes WHERE lang = ?", (lang,)
+        ).fetchone()
+        if row is not None and row[0] == scopes_key(kls, hashes):
+            scopes_meaning = json.loads(row[1])
+        db.close()
+    except sqlite3.DatabaseError:
+        return State({}, None)
+    return State(placed, scopes_meaning)
+
+
+def replay(kls: KnowledgesList, state: State, unknown_kl: list[str]) -> list[str]:
+    """
+    Adds back to `kls` the knowledges of `unknown_kl` that were placed by the
+    previous runs, and returns the list of remaining unknown knowledges.
+    A knowledge whose anchor is no longer a knowledge is not added back.
+    """
+    unknown = set(unknown_kl)
+    replayed: set[str] = set()
+    for fn, placed in state.placed.items():
+        for notion, anchor in placed:
+            if notion in unknown and notion not in replayed:
+                if anchor == "":
+                    if fn == kls.default_fn:
+                        kls.add_new_bag(notion)
+                        replayed.add(notion)
+                else:
+                    try:
+                        kls.define_synonym_of(notion, anchor)
+                        replayed.add(notion)
+                    except KeyError:
+                        pass
+    return [kl for kl in unknown_kl if kl not in replayed]
+
+
+def placed_knowledges(kls: KnowledgesList, fn: str) -> list[tuple[str, str]]:
+    """
+    Returns the knowledges added to some file since the last checkpoint, each with
+    the knowledge it is a synonym of, or "" if it is the first knowledge of a new bag.
+    """
+    kl_struct = kls.kls_list[fn]
+    placed: list[tuple[str, str]] = []
+    for b_id, bag in enumerate(kl_struct.get_all_bags()):
+        for notion in kl_struct.get_new_knowledges_in_bag(b_id):
+            placed.append((notion, "" if notion == bag[0] else bag[0]))
+    return placed
+
+
+def unchanged(kls: KnowledgesList, state: State) -> bool:
+    """
+    Returns whether the knowledges added to every file are exactly those added by
+    the previous run, in which case writing the knowledge files would not change them.
+    """
+    return all(
+        placed_knowledges(kls, kl.filename) == state.placed.get(kl.filename, [])
+        for kl in kls.get_all_kls_struct()
+    )
+
+
+def save(
+    path: Path,
+    kls: KnowledgesList,
+    scopes_meaning: dict[str, list[list[str]]],
+    lang: str,
+) -> None:
+    """
+    Stores the state of the knowledge files, as they currently are on the disk,
+    together with the knowledges added to `kls`.
+    Fails silently if the cache cannot be written.
+    """
+    hashes = {
+        kl.filename: fu.hash_file(kl.filename).hexdigest()
+        for kl in kls.get_all_kls_struct()
+    }
+    try:
+        db = connect(path)
+        with db:
+            for fn, h in hashes.items():
+                db.execute("DELETE FROM placed WHERE filename = ?", (file_key(fn),))
+                db.executemany(
+                    "INSERT INTO placed VALUES (?, ?, ?, ?)",
+                    (
+                        (file_key(fn), position, notion, anchor)
+                        for position, (notion, anchor) in enumerate(
+                            placed_knowledges(kls, fn)
+                        )
+                    ),
+                )
+                db.execute(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?)", (file_key(fn), h)
+                )
+            db.execute(
+                "INSERT OR REPLACE INTO scopes VALUES (?, ?, ?)",
+                (lang, scopes_key(kls, hashes), json.dumps(scopes_meaning)),
+            )
+        db.close()
+    except sqlite3.DatabaseError:
+        pass
@@ -0,0 +1,140 @@
+"""
+Instrumentation of the commands: wall time of their stages, counters and peak memory.
+
+Library modules delimit their stages with `stage` and increment counters with
+`count`. Unless `enable` was called, both return immediately.
+"""
+
+from __future__ import annotations  # Support of `|` for type union in Python 3.9
+
+from contextlib import contextmanager
+from typing import Iterator, TextIO
+
+import sys
+import time
+
+from knowledge_clustering.misc import emph
+
+ENABLED: bool = False
+# Total wall time of every stage, identified by the names of the stages enclosing it
+# and its own name, in the order in which they were first entered
+STAGES: dict[tuple[str, ...], float] = {}
+COUNTERS: dict[str, int] = {}
+CURRENT: list[str] = []  # Names of the stages that are currently entered
+
+
+class Stage:
+    """Context manager adding the time spent in its body to some stage."""
+
+    __slots__ = ("name", "path", "start")
+
+    def __init__(self, name: str):
+        self.name: str = name
+        self.path: tuple[str, ...] | None = None
+        self.start: float = 0.0
+
+    def __enter__(self) -> Stage:
+        if ENABLED:
+            CURRENT.append(self.name)
+            self.path = tuple(CURRENT)
+            STAGES.setdefault(self.path, 0.0)
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.path is not None:
+            elapsed = time.perf_counter() - self.start
+            STAGES[self.path] += elapsed
+            CURRENT.pop()
+
+
+def stage(name: str) -> Stage:
+    """Returns a context manager measuring the time spent in the stage `name`."""
+    return Stage(name)
+
+
+def count(name: str, n: int = 1) -> None:
+    """Adds `n` to the counter `name`."""
+    if ENABLED:
+        COUNTERS[name] = COUNTERS.get(name, 0) + n
+
+
+def enable() -> None:
+    """Enables the instrumentation, and resets the stages and counters."""
+    global ENABLED  # pylint: disable=global-statement
+    ENABLED = True
+    STAGES.clear()
+    COUNTERS.clear()
+    CURRENT.clear()
+
+
+def disable() -> None:
+    """Disables the instrumentation."""
+    global ENABLED  # pylint: disable=global-statement
+    ENABLED = False
+
+
+def peak_memory() -> int | None:
+    """
+    Returns the peak resident memory in bytes of the current process and of its
+    terminated children, or None if it is not available on this platform.
+    """
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+    except ImportError:  # Windows
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss is in bytes on macOS, and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else 1024 * peak
+
+
+def report(out: TextIO = sys.stdout) -> None:
+    """Prints the time spent in every stage, the counters and the peak memory."""
+    print("Timings:", file=out)
+    # Every stage is printed below the stage enclosing it
+    rank = {path: i for i, path in enumerate(STAGES)}
+    for path in sorted(
+        STAGES, key=lambda p: [rank[p[:i]] for i in range(1, len(p) + 1)]
+    ):
+        print(f"\t{'  ' * (len(path) - 1)}{path[-1]}: {STAGES[path]:.3f} s", file=out)
+    if COUNTERS:
+        print("Counters:", file=out)
+        for name, value in COUNTERS.items():
+            print(f"\t{name}: {value}", file=out)
+    peak = peak_memory()
+    if peak is not None:
+        print(f"Peak memory: {peak / 2**20:.1f} MiB", file=out)
+
+
+@contextmanager
+def session(
+    timings: bool, profile_filename: str | None, out: TextIO = sys.stdout
+) -> Iterator[None]:
+    """
+    Runs its body with the instrumentation enabled if `timings` is true, and prints
+    the report at the end. If `profile_filename` is given, the body is also run under
+    cProfile, whose statistics are dumped to this file (they can be read with
+    `python -m pstats`).
+    """
+    if timings:
+        enable()
+    profiler = None
+    if profile_filename is not None:
+        import cProfile  # pylint: disable=import-outside-toplevel
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with stage("total"):
+            yield
+    finally:
+        if profiler is not None and profile_filename is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_filename)
+            print(f"Profile written to {emph(profile_filename)}.", file=out)
+        if timings:
+            disable()
+            report(out)
@@ -2,13 +2,19 @@
 
 from __future__ import annotations  # Support of `|` for type union in Python 3.9
 
-from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, NamedTuple
 import toposort  # Topological sort pylint: disable=import-error
 
 import knowledge_clustering.file_updater as fu
 from knowledge_clustering import cst
+from knowledge_clustering import instrumentation as instr
+from knowledge_clustering.aho_corasick import Automaton
 from knowledge_clustering.misc import add_orange, add_bold
 
+# Maximal number of threads reading knowledge files
+MAX_READING_THREADS: int = 8
+
 
 class DocInfoTex(NamedTuple):
     """Lines of a TeX document."""
@@ -29,6 +35,64 @@ def flat(list_of_list):
     return [x for y in list_of_list for x in y]
 
 
+def parse_knowledge_file(
+    lines: list[str],
+) -> tuple[list[DocInfoTex | DocInfoKnowledge], list[list[str]]]:
+    """
+    Reads the lines of a knowledge file, without their new line characters, in a
+    single pass. Returns the blocks of the file and the bags of knowledges it
+    defines, see Knowledges.
+
+    Every line is stripped once, and classified by its first character. The parser
+    is a state machine, whose state is the kind of the current block:
+        - "tex": lines that are copied as such;
+        - "knowledge": a line `\\knowledge{...}`, followed by lines `| synonym`, and
+            lines `% | synonym` that are dropped;
+        - "discard": the line cst.DISCARD_LINE, followed by comments; these lines,
+            written by knowledge-clustering, are dropped.
+    """
+    discard_line: str = cst.DISCARD_LINE.strip()
+    document: list[DocInfoTex | DocInfoKnowledge] = []
+    bags: list[list[str]] = []
+    state: str = "tex"
+    block: list[str] = []
+    bag: list[str] = []
+
+    def push_block() -> None:
+        if state == "tex" and block:
+            document.append(DocInfoTex(lines=block))
+        elif state == "knowledge":
+            document.append(
+                DocInfoKnowledge(lines=block, command=block[0], number=len(bags))
+            )
+            bags.append(bag)
+
+    for line in lines:
+        stripped = line.strip()
+        first = stripped[:1]
+        if state == "discard":
+            if first == "%":
+                continue
+            state = "tex"
+        if first == "%" and stripped == discard_line:
+            push_block()
+            state, block = "discard", []
+        elif first == "\\" and stripped.startswith("\\knowledge{"):
+            push_block()
+            state, block, bag = "knowledge", [line], []
+        elif state == "knowledge":
+            if first == "|":
+                block.append(line)
+                bag.append(stripped[1:].strip())
+            elif first != "%" or not stripped[1:].lstrip().startswith("|"):
+                push_block()
+                state, block = "tex", [line]
+        else:
+            block.append(line)
+    push_block()
+    return document, bags
+
+
 class Knowledges:
     def __init__(self, filename):
         """
@@ -55,97 +119,25 @@ class Knowledges:
                     The position in the string corresponds to the "number" field in the above
                     document description.
         """
-        self.bags: list[list[str]] = []  # Lists of lists, containing knowledges.
         self.filename: str = filename
         self.original_hash = fu.hash_file(filename)
         with open(filename, encoding="utf-8") as file:
-            lines: list[str] = file.readlines()
-
-            document: list[DocInfoTex | DocInfoKnowledge] = []
-            knowledges: list[list[str]] = []
-
-            reading_mode: str = "tex"
-            current_block: list[str] = []
-            current_kl_cmd: str = ""
-            current_kl_strs: list[str] = []
-
-            def push_block():
-                nonlocal reading_mode
-                nonlocal document
-                nonlocal current_block
-                nonlocal current_kl_cmd
-                nonlocal current_kl_strs
-                nonlocal knowledges
-                nonlocal current_kl_strs
-                if reading_mode == "tex" and len(current_block) > 0:
-                    document.append(DocInfoTex(lines=current_block))
-                    current_block = []
-                elif reading_mode == "knowledge":
-                    document.append(
-                        DocInfoKnowledge(
-                            lines=current_block,
-                            command=current_kl_cmd,
-                            number=len(knowledges),
-                        )
-                    )
-                    current_block = []
-                    current_kl_cmd = ""
-                    knowledges.append(current_kl_strs)
-                    current_kl_strs = []
-
-            def line_is_discard(line):
-                return line.strip() == cst.DISCARD_LINE.strip()
-
-            def line_is_comment(line):
-                return line.strip().startswith("%")
-
-            def line_is_knowledge(line):
-                return line.strip().startswith("\\knowledge{")
-
-            def bar_knowledge_from_line(line):
-                line = line.strip()
-                if line.startswith("|"):
-                    return line[1:].strip()
-                return None
-
-            def line_is_comment_bar_knowledge_from_line(line):
-                line = line.strip()
-                if line.startswith("%"):
-                    return (line[1:].strip()).startswith("|")
-                return False
-
-            for line in lines:
-                if line[-1] == "\n":
-                    line = line[:-1]
-                if reading_mode == "discard" and not line_is_comment(line):
-                    reading_mode = "tex"
-                if line_is_discard(line):
-                    push_block()
-                    reading_mode = "discard"
-                elif line_is_knowledge(line):
-                    push_block()
-                    reading_mode = "knowledge"
-                    current_kl_cmd = line
-                    current_block = [line]
-                    current_kl_strs = []
-                elif reading_mode == "knowledge":
-                    kl = bar_knowledge_from_line(line)
-                    if kl is not None:
-                        current_block.append(line)
-                        current_kl_strs.append(kl)
-                    elif line_is_comment_bar_knowledge_from_line(line):
-                        pass
-                    else:
-                        push_block()
-                        reading_mode = "tex"
-                        current_block = [line]
-                elif reading_mode == "tex":
-                    current_block.append(line)
-            push_block()
-            self.document = document
-            self.bags = knowledges
-            self.nb_known_bags: int = len(self.bags)
-            self.length_known_bags: list[int] = [len(bag) for bag in self.bags]
+            lines: list[str] = file.read().split("\n")
+        if lines[-1] == "":
+            # The file is empty or ends with a new line
+            lines.pop()
+        self.document: list[DocInfoTex | DocInfoKnowledge]
+        self.bags: list[list[str]]  # Lists of lists, containing knowledges.
+        self.document, self.bags = parse_knowledge_file(lines)
+        self.nb_known_bags: int = len(self.bags)
+        self.length_known_bags: list[int] = [len(bag) for bag in self.bags]
+        # Maps every knowledge to the first bag containing it
+        self.bag_of: dict[str, int] = {}
+        for b_id, bag in enumerate(self.bags):
+            for kl in bag:
+                self.bag_of.setdefault(kl, b_id)
+        # Bags containing knowledges added since the last checkpoint
+        self.changed_bags: set[int] = set()
 
     def get_all_bags(self) -> list[list[str]]:
         """Returns all bags as a list of lists of strings."""
@@ -181,69 +173,92 @@ class Knowledges:
 
     def add_new_bag(self, kl: str) -> None:
         """Adds a new bag that contains only the string `kl`."""
-        self.bags.append([kl])
+        self.bags.append([])
+        self.add_to_bag(kl, len(self.bags) - 1)
+
+    def add_to_bag(self, kl: str, b_id: int) -> None:
+        """Adds the string `kl` at the end of the `b_id`-th bag."""
+        self.bags[b_id].append(kl)
+        if b_id < self.bag_of.get(kl, len(self.bags)):
+            self.bag_of[kl] = b_id
+        self.changed_bags.add(b_id)
 
     def define_synonym_of(self, kl1: str, kl2: str) -> None:
         """
         Defines a new knowledge (string) `kl1` as a new synonym of the already
         existing knowledge (string) `kl2`.
         """
-        for b_id, bag in enumerate(self.bags):
-            if kl2 in bag:
-                self.bags[b_id].append(kl1)
-                return
-        raise KeyError(f"Error: {kl2} is not a knowledge.")
+        if kl2 not in self.bag_of:
+            raise KeyError(f"Error: {kl2} is not a knowledge.")
+        self.add_to_bag(kl1, self.bag_of[kl2])
 
     def was_changed(self) -> bool:
         """
         Returns whether kl has new bags or new synonyms.
         """
+        return len(self.changed_bags) > 0
+
+    def get_new_knowledges(self) -> list[str]:
+        """Returns all knowledges that were added since the last checkpoint,
+        as a list of strings."""
+        return flat(
+            [self.get_new_knowledges_in_bag(b_id) for b_id in sorted(self.changed_bags)]
+        )
+
+    def lines(self, nocomment: bool = False) -> Iterator[str]:
+        """
+        Returns the lines of the file containing the knowledges, together with the new
+        synonyms and new knowledges.
+        """
+        for b in self.document:
+            if isinstance(b, DocInfoTex):
+                for line in b.lines:
+                    yield line + "\n"
+            elif isinstance(b, DocInfoKnowledge):
+                for line in b.lines:
+                    yield line + "\n"
+                if b.number < self.nb_known_bags:
+                    for kl in self.get_new_knowledges_in_bag(b.number):
+                        yield f" | {kl}\n" if nocomment else f"%  | {kl}\n"
         if len(self.get_new_bags()) > 0:
-            return True
-        for b_id in range(len(self.get_old_bags())):
-            if len(self.get_new_knowledges_in_bag(b_id)) > 0:
-                return True
-        return False
+            yield cst.DISCARD_LINE + "\n"
+            for bag in self.get_new_bags():
+                if len(bag) > 0:
+                    yield "%\n"
+                    yield "%\\knowledge{notion}\n"
+                    for kl in bag:
+                        yield f" | {kl}\n" if nocomment else f"%  | {kl}\n"
 
     def write_knowledges_in_file(self, nocomment: bool = False) -> None:
         """
         Writes the new synonyms and new knowledges in the file containing the knowledges.
         """
         with fu.AtomicUpdate(self.filename, original_hash=self.original_hash) as file:
-            for b in self.document:
-                if isinstance(b, DocInfoTex):
-                    for line in b.lines:
-                        file.write(line + "\n")
-                elif isinstance(b, DocInfoKnowledge):
-                    for line in b.lines:
-                        file.write(line + "\n")
-                    if b.number < self.nb_known_bags:
-                        for kl in self.get_new_knowledges_in_bag(b.number):
-                            file.write((f" | {kl}\n" if nocomment else f"%  | {kl}\n"))
-            if len(self.get_new_bags()) > 0:
-                file.write(cst.DISCARD_LINE + "\n")
-                for bag in self.get_new_bags():
-                    if len(bag) > 0:
-                        file.write("%\n")
-                        file.write("%\\knowledge{notion}\n")
-                        for kl in bag:
-                            file.write((f" | {kl}\n" if nocomment else f"%  | {kl}\n"))
+            file.writelines(self.lines(nocomment))
 
 
 class KnowledgesList:
     def __init__(self, kls_filenames: list[str]):
         """
-        Reads a list of knowledge files.
+        Reads a list of knowledge files. Multiple files are read concurrently, by a
+        pool of at most MAX_READING_THREADS threads.
 
         Args:
             kls_list: the list of filenames containing knowledges.
         """
         self.nb_file: int = len(kls_filenames)
-        self.kls_list: dict[str, Knowledges] = {
-            fn: Knowledges(fn) for fn in kls_filenames
-        }
+        if self.nb_file > 1:
+            with ThreadPoolExecutor(
+                max_workers=min(self.nb_file, MAX_READING_THREADS)
+            ) as pool:
+                kls_structs = list(pool.map(Knowledges, kls_filenames))
+        else:
+            kls_structs = [Knowledges(fn) for fn in kls_filenames]
+        self.kls_list: dict[str, Knowledges] = dict(zip(kls_filenames, kls_structs))
         self.default_fn: str = kls_filenames[self.nb_file - 1]
-        self.compute_dependency_graph()
+        # Computed on first access, see compute_dependency_graph
+        self.__dependency: dict[str, set[str]] | None = None
+        self.__all_knowledges_sorted: list[str] | None = None
 
     def get_all_kls_struct(self) -> list[Knowledges]:
         """Returns the list of all knowledge structures"""
@@ -263,23 +278,40 @@ class KnowledgesList:
 
     def get_sorted_knowledges(self) -> list[str]:
         """Returns all knowledges, sorted by topological sort."""
-        return self.all_knowledges_sorted
+        if self.__all_knowledges_sorted is None:
+            self.compute_dependency_graph()
+        return self.__all_knowledges_sorted  # type: ignore
+
+    @property
+    def dependency(self) -> dict[str, set[str]]:
+        """
+        Maps every knowledge to the set of other knowledges that are substrings of it.
+        """
+        if self.__dependency is None:
+            self.compute_dependency_graph()
+        return self.__dependency  # type: ignore
 
     def add_new_bag(self, kl: str) -> None:
         """Adds a new bag that contains only the string `kl`."""
         self.default_kls().add_new_bag(kl)
 
+    def location(self, kl: str) -> tuple[str, int]:
+        """
+        Returns the name of the first file containing the knowledge (string) `kl`,
+        and the index of the first bag of this file containing it.
+        """
+        for fn, kls in self.kls_list.items():
+            if kl in kls.bag_of:
+                return fn, kls.bag_of[kl]
+        raise KeyError(f"Error: {kl} is not a knowledge.")
+
     def define_synonym_of(self, kl1: str, kl2: str) -> None:
         """
         Defines a new knowledge (string) `kl1` as a new synonym of the already
         existing knowledge (string) `kl2`.
         """
-        for kls in self.kls_list.values():
-            for b_id, bag in enumerate(kls.bags):
-                if kl2 in bag:
-                    kls.bags[b_id].append(kl1)
-                    return
-        raise KeyError(f"Error: {kl2} is not a knowledge.")
+        fn, b_id = self.location(kl2)
+        self.kls_list[fn].add_to_bag(kl1, b_id)
 
     def write_knowledges_in_file(self, nocomment: bool = False) -> None:
         """
@@ -298,32 +330,39 @@ class KnowledgesList:
         checkpoint, as a list of strings."""
         if fn not in self.kls_list:
             raise KeyError(f"No knowledge file named {fn}.")
-        return flat(
-            [
-                self.kls_list[fn].get_new_knowledges_in_bag(bag_id)
-                for bag_id in range(len(self.kls_list[fn].get_all_bags()))
-            ]
-        )
+        return self.kls_list[fn].get_new_knowledges()
 
     def compute_dependency_graph(self) -> None:
         """
         Computes the dependency graph of all knowledges, for the substring relation.
         Then, sort all knowledges using topological sorting.
-        Result are stored in self.dependency and self.all_knowledges_sorted.
+        Result are stored in self.dependency and self.get_sorted_knowledges(); this
+        method is called on the first access to one of them.
+
+        The knowledges that are substrings of some knowledge are found in a single
+        pass over it, using an Aho–Corasick automaton recognising all knowledges.
         """
-        dependency: dict[str, set[str]] = {}
-        dependency_reversed: dict[str, set[str]] = {}
-        for s1 in self.get_all_knowledges():
-            dependency[s1] = {
-                s2 for s2 in self.get_all_knowledges() if s2 in s1 and s1 != s2
-            }
-            dependency_reversed[s1] = {
-                s2 for s2 in self.get_all_knowledges() if s1 in s2 and s1 != s2
-            }
-        self.dependency: dict[str, set[str]] = dependency
-        self.all_knowledges_sorted: list[str] = list(
-            toposort.toposort_flatten(dependency_reversed)
-        )
+        with instr.stage("dependency graph"):
+            knowledges: list[str] = list(dict.fromkeys(self.get_all_knowledges()))
+            patterns: list[str] = [kl for kl in knowledges if kl != ""]
+            automaton = Automaton(patterns)
+            dependency: dict[str, set[str]] = {s1: set() for s1 in knowledges}
+            dependency_reversed: dict[str, set[str]] = {s1: set() for s1 in knowledges}
+            for s1 in patterns:
+                for _, p_id in automaton.find_all(s1):
+                    s2 = patterns[p_id]
+                    if s1 != s2:
+                        dependency[s1].add(s2)
+                        dependency_reversed[s2].add(s1)
+            if "" in dependency:
+                # The empty knowledge is a substring of every other knowledge
+                for s1 in patterns:
+                    dependency[s1].add("")
+                    dependency_reversed[""].add(s1)
+            self.__dependency = dependency
+            self.__all_knowledges_sorted = list(
+                toposort.toposort_flatten(dependency_reversed)
+            )
 
 
 def remove_redundant_files(list_filenames: list[str]) -> list[str]:
@@ -0,0 +1,110 @@
+"""
+Persistent cache of the features of notions (tokenization, POS tagging and stemming),
+stored in a SQLite database next to the knowledge files.
+"""
+
+from __future__ import annotations  # Support of `|` for type union in Python 3.9
+
+from pathlib import Path
+from typing import Iterable
+
+import json
+import sqlite3
+import nltk  # type: ignore
+
+from knowledge_clustering import distance, cst, _version
+
+CACHE_VERSION: str = "1"
+
+
+def cache_path(kl_filename: str) -> Path:
+    """Returns the path of the cache associated to some knowledge file."""
+    return Path(kl_filename).parent / cst.NLP_CACHE_FILENAME
+
+
+def connect(path: Path) -> sqlite3.Connection:
+    """
+    Opens the cache, creating its tables if needed. If the cache was produced by
+    another version of the cache format, of knowledge-clustering or of NLTK, the
+    content of all its tables is discarded.
+    """
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS features (notion TEXT, lang TEXT, normalised TEXT, \
+scope TEXT, words TEXT, stems TEXT, PRIMARY KEY (notion, lang))"
+    )
+    # The features depend on the normalisation of notions and on the language
+    # configuration, which can change with every version of knowledge-clustering
+    version = f"{CACHE_VERSION}/{_version.VERSION}/{nltk.__version__}"
+    row = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    if row is None or row[0] != version:
+        tables = db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name != 'meta'"
+        ).fetchall()
+        for (table,) in tables:
+            db.execute(f"DELETE FROM {table}")
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+        db.commit()
+    return db
+
+
+def load(path: Path, lang: str) -> int:
+    """
+    Loads the features of all notions stored in the cache for some language,
+    and returns the number of notions loaded.
+    Corrupted caches are ignored.
+    """
+    if not path.exists():
+        return 0
+    try:
+        db = connect(path)
+        rows = db.execute(
+            "SELECT notion, normalised, scope, words, stems FROM features \
+WHERE lang = ?",
+            (lang,),
+        ).fetchall()
+        db.close()
+    except sqlite3.DatabaseError:
+        return 0
+    for notion, normalised, scope, words, stems in rows:
+        distance.add_notion_features(
+            distance.NotionFeatures(
+                notion,
+                normalised,
+                scope,
+                tuple(json.loads(words)),
+                tuple(json.loads(stems)),
+            ),
+            lang,
+        )
+    return len(rows)
+
+
+def save(path: Path, notions: Iterable[str], lang: str) -> None:
+    """
+    Stores the features of the given notions in the cache for some language.
+    Entries of notions that are not given are evicted.
+    Fails silently if the cache cannot be written.
+    """
+    try:
+        db = connect(path)
+        with db:
+            db.execute("DELETE FROM features WHERE lang = ?", (lang,))
+            db.executemany(
+                "INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        f.notion,
+                        lang,
+                        f.normalised,
+                        f.scope,
+                        json.dumps(f.words),
+                        json.dumps(f.stems),
+                    )
+                    for f in (distance.notion_features(kl, lang) for kl in notions)
+                ),
+            )
+        db.close()
+    except sqlite3.DatabaseError:
+        pass
@@ -1,22 +1,30 @@
 """Infer the scope from known knowledges."""
 
 from __future__ import annotations  # Support of `|` for type union in Python 3.9
-from typing import TypeVar
-
-import copy
 
 import knowledge_clustering.distance as dist
 
-T = TypeVar("T")  # Generic type
 
+def meanings_in_bag(
+    scoped_words: list[list[str]], unscoped_words: list[list[str]], lang: str
+) -> list[list[str]]:
+    """
+    Takes the words of the knowledges of a bag that have some scope, and the words of
+    the knowledges of this bag that have no scope. For every pair of such knowledges
+    (kl1, kl2), in order, if every word of kl1 appears in kl2, the words of kl2 not
+    appearing in kl1 are a possible meaning of the scope.
 
-def union_list_of_lists(l1: list[T], l2: list[T]) -> list[T]:
-    """Returns the union (without repetition) of two lists of lists."""
-    s = copy.copy(l1)
-    for sublist in l2:
-        if sublist not in s:
-            s.append(sublist)
-    return s
+    Since inclusion_sets_of_words removes the matched words from both lists, the lists
+    are modified, and a word is matched at most once.
+    """
+    result: list[list[str]] = []
+    for kl1_words in scoped_words:
+        for kl2_words in unscoped_words:
+            if dist.inclusion_sets_of_words(kl1_words, kl2_words, ("",), lang):
+                # If every word of kl1 appears in kl2 and kl2 has an empty scope,
+                # return the words in kl2 not appearing in kl1
+                result.append([w for w in kl2_words if w not in kl1_words])
+    return result
 
 
 def infer_scope(list_kl: list[str], scope: str, lang: str) -> list[list[str]]:
@@ -31,19 +39,12 @@ def infer_scope(list_kl: list[str], scope: str, lang: str) -> list[list[str]]:
         "ordinal word", "scattered language"] for the scope `some-scope` will return
         the list [["countable", "ordinal"], ["ordinal"]].
     """
-    result: list[list[str]] = []
-    list_kl_broke: list[tuple[list[str], str]] = [
-        dist.breakup_notion(kl, lang) for kl in list_kl
-    ]
-    for kl1_words, sc1 in list_kl_broke:
-        if sc1 == scope:
-            for kl2_words, sc2 in list_kl_broke:
-                if sc2 == "":
-                    if dist.inclusion_sets_of_words(kl1_words, kl2_words, ("",), lang):
-                        # If every word of kl1 appears in kl2 and kl2 has an empty scope,
-                        # return the words in kl2 not appearing in kl1
-                        result.append([w for w in kl2_words if w not in kl1_words])
-    return result
+    list_features = [dist.notion_features(kl, lang) for kl in list_kl]
+    return meanings_in_bag(
+        [list(f.words) for f in list_features if f.scope == scope],
+        [list(f.words) for f in list_features if f.scope == ""],
+        lang,
+    )
 
 
 def infer_all_scopes(
@@ -52,19 +53,34 @@ def infer_all_scopes(
     """
     Given known knowledges and a langage, returns the infer meaning of scopes occuring
     in said these knowledges.
+
+    Bags are read once: the meanings of every scope occurring in a bag are inferred
+    from this bag, and are added to the meanings of this scope if they are new.
     """
     list_scopes: set[str] = {
         sc for bag in known_knowledges for (_, sc) in map(dist.extract_scope, bag)
     }
-    if "" in list_scopes:
-        list_scopes.remove("")
+    list_scopes.discard("")
     scopes_meaning: dict[str, list[list[str]]] = {sc: [] for sc in list_scopes}
+    known_meanings: dict[str, set[tuple[str, ...]]] = {sc: set() for sc in list_scopes}
+    for bag in known_knowledges:
+        list_features = [dist.notion_features(kl, lang) for kl in bag]
+        unscoped = [f.words for f in list_features if f.scope == ""]
+        if not unscoped:
+            continue
+        scoped: dict[str, list[list[str]]] = {}
+        for f in list_features:
+            if f.scope in scopes_meaning:
+                scoped.setdefault(f.scope, []).append(list(f.words))
+        for scope, scoped_words in scoped.items():
+            for meaning in meanings_in_bag(
+                scoped_words, [list(words) for words in unscoped], lang
+            ):
+                if tuple(meaning) not in known_meanings[scope]:
+                    known_meanings[scope].add(tuple(meaning))
+                    scopes_meaning[scope].append(meaning)
     for scope in list_scopes:
-        for bag in known_knowledges:
-            scopes_meaning[scope] = union_list_of_lists(
-                scopes_meaning[scope], infer_scope(bag, scope, lang)
-            )
-        if [scope] not in scopes_meaning[scope]:
+        if (scope,) not in known_meanings[scope]:
             scopes_meaning[scope].append([scope])
     return scopes_meaning
 
@@ -9,17 +9,12 @@ import os
 import sys
 import click
 from click_default_group import DefaultGroup  # type: ignore
-import nltk  # type: ignore
 
-from knowledge_clustering import (
-    add_anchor,
-    add_quotes,
-    clustering,
-    cst,
-    _version,
-    autofinder,
-)
-from knowledge_clustering.check_update import check_update
+# The modules used by a single command (and the heavy dependencies they import,
+# such as NLTK) are imported by this command.
+# pylint: disable=import-outside-toplevel
+from knowledge_clustering import cst, _version, autofinder, instrumentation
+from knowledge_clustering.check_update import UpdateCheck
 from knowledge_clustering.misc import add_red, add_bold
 
 
@@ -33,6 +28,21 @@ class AliasedGroup(DefaultGroup):
         return DefaultGroup.get_command(self, ctx, cmd_name)
 
 
+class ConfigFileOption(click.Option):
+    """
+    Option whose help mentions the folder of the configuration files, which is
+    only resolved when the help is printed.
+    """
+
+    def get_help_record(self, ctx):
+        template = self.help
+        self.help = (template or "").format(config_dir=cst.CONFIG_DIR)
+        try:
+            return super().get_help_record(ctx)
+        finally:
+            self.help = template
+
+
 @click.group(cls=AliasedGroup, default="cluster", default_if_no_args=True)
 @click.version_option(_version.VERSION)
 def cli():
@@ -42,6 +52,8 @@ def cli():
 @cli.command()
 def init():
     """Downloads the required NLTK packages."""
+    import nltk  # type: ignore
+
     nltk.download("punkt")
     nltk.download("punkt_tab")
     nltk.download("averaged_perceptron_tagger")
@@ -105,9 +117,56 @@ the possible meaning of those scope inferred by knowledge-clustering.",
     "--config-file",
     "-c",
     "config_filename",
+    cls=ConfigFileOption,
     default=None,
-    help=f"Specify the configuration file. By default the configuration file \
-in the folder {cst.CONFIG_DIR} corresponding to your language is used.",
+    help="Specify the configuration file. By default the configuration file \
+in the folder {config_dir} corresponding to your language is used.",
+)
+@click.option(
+    "--cache/--no-cache",
+    "cache",
+    default=False,
+    help=f"Store the result of the tokenization, tagging and stemming of knowledges \
+in a file {cst.NLP_CACHE_FILENAME} next to the default knowledge file, so that \
+subsequent runs are faster.",
+)
+@click.option(
+    "--incremental/--no-incremental",
+    "-i/ ",
+    "incremental",
+    default=False,
+    help=f"Reuse the state of the previous run, stored in {cst.NLP_CACHE_FILENAME}: \
+knowledges added by previous runs to knowledge files that were not modified since \
+are added back to the same bags instead of being clustered again.",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    "jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of processes used to compute the distances between knowledges.",
+)
+@click.option(
+    "--cache-stats/--no-cache-stats",
+    "cache_stats",
+    default=False,
+    help="Print the number of hits, misses and entries of the in-memory caches \
+used to compute distances.",
+)
+@click.option(
+    "--timings/--no-timings",
+    "timings",
+    default=False,
+    help="Print the time spent in every stage of the command, some counters, \
+and the peak memory.",
+)
+@click.option(
+    "--profile",
+    "profile_filename",
+    type=click.Path(file_okay=True, dir_okay=False, writable=True),
+    default=None,
+    help="Run the command under cProfile, and write its statistics to this file.",
 )
 def cluster(
     kl_filename: tuple[str],
@@ -117,19 +176,41 @@ def cluster(
     print_kl: bool,
     noupdate: bool,
     config_filename: None | str,
+    cache: bool,
+    incremental: bool,
+    jobs: int,
+    cache_stats: bool,
+    timings: bool,
+    profile_filename: None | str,
 ):
     """
     Defines, as a comment and in the knowledge files, all the knowledges occuring in the file.
     """
+    from knowledge_clustering import clustering, distance
+
+    update = None if noupdate else UpdateCheck()
     try:
-        if not dg_filename:
-            dg_filename = autofinder.get_unique_diagnose_file(Path("."))
-        kl_filename = list(kl_filename)
-        if not kl_filename:
-            kl_filename = autofinder.get_knowledge_files(Path("."))
-        clustering.app(kl_filename, dg_filename, scope, print_kl, lang, config_filename)
-        if not noupdate:
-            check_update()
+        with instrumentation.session(timings, profile_filename):
+            if not dg_filename:
+                dg_filename = autofinder.get_unique_diagnose_file(Path("."))
+            kl_filename = list(kl_filename)
+            if not kl_filename:
+                kl_filename = autofinder.get_knowledge_files(Path("."))
+            clustering.app(
+                kl_filename,
+                dg_filename,
+                scope,
+                print_kl,
+                lang,
+                config_filename,
+                cache,
+                incremental,
+                jobs,
+            )
+            if cache_stats or timings:
+                distance.print_cache_stats()
+        if update is not None:
+            update.report()
     except (autofinder.NoFile, autofinder.TooManyFiles) as e:
         print(add_bold(add_red("\n[Error] ")) + e.args[0])
 
@@ -169,25 +250,120 @@ with `default.kl`.",
     help="When finding a match, number of lines (preceding the match) that are printed \
 in the prompt to the user.",
 )
+@click.option(
+    "--batch",
+    "-b",
+    "policy",
+    type=click.Choice(list(cst.ADDQUOTES_POLICIES)),
+    default=None,
+    help="Don't ask anything: with `exact`, add quotes around knowledges that occur \
+as such, and with `all`, also define the words containing knowledges as synonyms \
+of these knowledges and add quotes around them.",
+)
+@click.option(
+    "--json",
+    "json_filename",
+    type=click.Path(file_okay=True, dir_okay=False, writable=True),
+    default=None,
+    help="Write the quotes to add and the new synonyms to this file instead of \
+modifying the TeX and knowledge files. They can be added later using --apply.",
+)
+@click.option(
+    "--apply",
+    "apply_filename",
+    type=click.Path(exists=True, file_okay=True, dir_okay=False, readable=True),
+    default=None,
+    help="Add the quotes and the synonyms written to this file by --json, provided \
+that the TeX file was not modified since.",
+)
+@click.option(
+    "--diff/--no-diff",
+    "diff",
+    default=False,
+    help="Print the changes as a unified diff instead of modifying the TeX and \
+knowledge files.",
+)
+@click.option(
+    "--project/--no-project",
+    "project",
+    default=False,
+    help="Also process the files included by the TeX file using \\input or \\include, \
+recursively.",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    "jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of processes used to process the TeX files of the project.",
+)
 @click.option(
     "--no-update/--update",
     "-N/ ",
     "noupdate",
     default=False,
 )
-def addquotes(tex_filename: str, kl_filename: str, print_line: int, noupdate: bool):
+@click.option(
+    "--timings/--no-timings",
+    "timings",
+    default=False,
+    help="Print the time spent in every stage of the command, some counters, \
+and the peak memory.",
+)
+@click.option(
+    "--profile",
+    "profile_filename",
+    type=click.Path(file_okay=True, dir_okay=False, writable=True),
+    default=None,
+    help="Run the command under cProfile, and write its statistics to this file.",
+)
+def addquotes(
+    tex_filename: str,
+    kl_filename: str,
+    print_line: int,
+    policy: None | str,
+    json_filename: None | str,
+    apply_filename: None | str,
+    diff: bool,
+    project: bool,
+    jobs: int,
+    noupdate: bool,
+    timings: bool,
+    profile_filename: None | str,
+):
     """
     Finds knowledges defined in the knowledge files that appear in tex file without quote
     symbols. Proposes to add quotes around them.
     """
+    from knowledge_clustering import add_quotes
+
+    update = None if noupdate else UpdateCheck()
     try:
-        kl_filename = list(kl_filename)
-        if not kl_filename:
-            kl_filename = autofinder.get_knowledge_files(Path("."))
-        add_quotes.app(tex_filename, kl_filename, print_line)
-        if not noupdate:
-            check_update()
-    except (autofinder.NoFile, autofinder.TooManyFiles) as e:
+        with instrumentation.session(timings, profile_filename):
+            kl_filename = list(kl_filename)
+            if not kl_filename:
+                kl_filename = autofinder.get_knowledge_files(Path("."))
+            if apply_filename is not None:
+                add_quotes.apply(apply_filename, tex_filename, kl_filename, diff)
+            else:
+                add_quotes.app(
+                    tex_filename,
+                    kl_filename,
+                    print_line,
+                    policy=policy,
+                    json_filename=json_filename,
+                    diff=diff,
+                    project=project,
+                    jobs=jobs,
+                )
+        if update is not None:
+            update.report()
+    except (
+        autofinder.NoFile,
+        autofinder.TooManyFiles,
+        add_quotes.OutdatedQuotes,
+    ) as e:
         print(add_bold(add_red("\n[Error] ")) + e.args[0])
 
 
@@ -210,19 +386,60 @@ def addquotes(tex_filename: str, kl_filename: str, print_line: int, noupdate: bo
     help="Number of characters tolerated between an anchor point and the introduction \
 of a knowledge. (Default value: 200)",
 )
+@click.option(
+    "--project/--no-project",
+    "project",
+    default=False,
+    help="Also process the files included by the TeX file using \\input or \\include, \
+recursively.",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    "jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of processes used to process the TeX files of the project.",
+)
 @click.option(
     "--no-update/--update",
     "-N/ ",
     "noupdate",
     default=False,
 )
-def anchor(tex_filename: str, space: int, noupdate: bool):
+@click.option(
+    "--timings/--no-timings",
+    "timings",
+    default=False,
+    help="Print the time spent in every stage of the command, some counters, \
+and the peak memory.",
+)
+@click.option(
+    "--profile",
+    "profile_filename",
+    type=click.Path(file_okay=True, dir_okay=False, writable=True),
+    default=None,
+    help="Run the command under cProfile, and write its statistics to this file.",
+)
+def anchor(
+    tex_filename: str,
+    space: int,
+    project: bool,
+    jobs: int,
+    noupdate: bool,
+    timings: bool,
+    profile_filename: None | str,
+):
     """
     Prints warning when a knowledge is introduced but is not preceded by an anchor point.
     """
-    add_anchor.app(tex_filename, space)
-    if not noupdate:
-        check_update()
+    from knowledge_clustering import add_anchor
+
+    update = None if noupdate else UpdateCheck()
+    with instrumentation.session(timings, profile_filename):
+        add_anchor.app(tex_filename, space, project=project, jobs=jobs)
+    if update is not None:
+        update.report()
 
 
 if __name__ == "__main__":
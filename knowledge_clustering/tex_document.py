@@ -1,10 +1,21 @@
 """Handling a Tex document."""
 
 from __future__ import annotations  # Support of `|` for type union in Python 3.9
+from array import array
 from typing import TextIO
 
+import bisect
+import re
+
 from knowledge_clustering import misc
 
+UNDEFINED: int = -1  # Value of the pointer of a position that has no antecedent
+
+# Tokens read by the transducer of TexDocument.__clean: a run of normal letters,
+# a run of spaces and tabulations, a new line, or a comment (including the new line
+# ending it).
+TOKEN_REGEX = re.compile(r"[^ \t\n%]+|[ \t]+|\n|%[^\n]*\n?")
+
 
 class TexDocument:
     """Class for handling a tex document."""
@@ -18,21 +29,21 @@ class TexDocument:
 
     def __update_col_line(self) -> None:
         """
-        Compute two arrays, saying for each index i of self.text, at what column and
-        what line of the text this index is located.
+        Computes the sorted array of positions of new lines in self.tex_code,
+        from which the line and column of any position are computed.
         """
-        self.find_line: list[int] = [0] * len(self.tex_code)
-        self.find_col: list[int] = [0] * len(self.tex_code)
-        line: int = 1
-        col: int = 1
-        for position, letter in enumerate(self.tex_code):
-            self.find_line[position] = line
-            self.find_col[position] = col
-            if letter == "\n":
-                line += 1
-                col = 1
-            else:
-                col += 1
+        self.newlines: array = array(
+            "i", (m.start() for m in re.finditer("\n", self.tex_code))
+        )
+
+    def find_line(self, position: int) -> int:
+        """Returns the line (starting from 1) of some position of self.tex_code."""
+        return bisect.bisect_left(self.newlines, position) + 1
+
+    def find_col(self, position: int) -> int:
+        """Returns the column (starting from 1) of some position of self.tex_code."""
+        k = bisect.bisect_left(self.newlines, position)
+        return position - (self.newlines[k - 1] if k > 0 else -1)
 
     def __clean(self):
         """
@@ -40,7 +51,9 @@ class TexDocument:
         Converts spaces, tabulations and new lines into a single space, except
         if there is two consecutive new lines. Removes commented lines.
         The cleaned file is stored in self.tex_cleaned. A pointer
-        from tex_cleaned to tex_code, in the form of an array, is produced in self.pointer.
+        from tex_cleaned to tex_code, in the form of an array, is produced in self.pointer;
+        positions of tex_cleaned that do not correspond to a position of tex_code
+        are mapped to UNDEFINED.
         """
 
         # Essentially, the algorithm is a deterministic transducer with five states
@@ -52,51 +65,40 @@ class TexDocument:
         # 3: the last character is not normal,
         #   and at least two new lines were read since the last normal character
         # 4: the line is commented.
-        def is_normal(letter: str) -> bool:
-            return letter not in [" ", "\t", "\n", "%"]
-
-        def transition(
-            state: int, letter: str, counter: int
-        ) -> tuple[int, str, int | None]:
-            """
-            Input: curent state, input letter and the size of produced output so far
-            Output: returns the new state, the output, and the pointer of the input letter.
-            """
-            if is_normal(letter):
-                if state == 4:
-                    return (4, "", None)
-                return (0, letter, counter)
+        # Since a comment is read until the end of its line, state 4 is only reached
+        # at the end of the document.
+        # The transducer reads the document token by token rather than letter by letter.
+        state: int = 0
+        output: list[str] = []
+        pointer: array = array("i")
+        for token in TOKEN_REGEX.finditer(self.tex_code):
+            position: int = token.start()
+            letter: str = self.tex_code[position]
             if letter == "%":
-                return (4, "", None)
-            if letter == "\n":
-                if state == 4:
-                    return (0, "", None)
+                state = 0 if token.group().endswith("\n") else 4
+            elif letter == "\n":
                 if state == 0:
-                    return (2, " ", None)
-                if state == 1:
-                    return (2, "", None)
-                if state == 2:
-                    return (3, "\\par ", counter)
-                return (3, "", None)
-            if letter in [" ", "\t"]:
+                    output.append(" ")
+                    pointer.append(UNDEFINED)
+                    state = 2
+                elif state == 1:
+                    state = 2
+                elif state == 2:
+                    output.append("\\par ")
+                    pointer.append(position)
+                    pointer.extend([UNDEFINED] * 4)
+                    state = 3
+            elif letter in [" ", "\t"]:
                 if state == 0:
-                    return (1, " ", counter)
-                return (state, "", None)
-            raise KeyError("Transition not defined", state, letter)
-
-        state: int = 0
-        tex_cleaned: str = ""
-        m: int = 0
-        pointer: list[None | int] = []
-        for position, letter in enumerate(self.tex_code):
-            state, output, input_pointer = transition(state, letter, m)
-            tex_cleaned += output
-            m += len(output)
-            # Put position at index input_pointer
-            if input_pointer is not None:
-                pointer += [None] * (input_pointer - len(pointer)) + [position]
-        self.tex_cleaned: str = tex_cleaned
-        self.pointer: list[None | int] = pointer
+                    output.append(" ")
+                    pointer.append(position)
+                    state = 1
+            else:
+                output.append(token.group())
+                pointer.extend(range(position, token.end()))
+                state = 0
+        self.tex_cleaned: str = "".join(output)
+        self.pointer: array = pointer
 
     def print(self, start: int, end: int, n: int, out: TextIO):
         """
@@ -106,11 +108,11 @@ class TexDocument:
         """
         start_p = self.pointer[start]
         end_p = self.pointer[end]
-        if isinstance(start_p, int) and isinstance(end_p, int):
-            l_start: int = self.find_line[start_p]
-            c_start: int = self.find_col[start_p]
-            l_end: int = self.find_line[end_p]
-            c_end: int = self.find_col[end_p]
+        if UNDEFINED not in (start_p, end_p):
+            l_start: int = self.find_line(start_p)
+            c_start: int = self.find_col(start_p)
+            l_end: int = self.find_line(end_p)
+            c_end: int = self.find_col(end_p)
             for i in range(max(0, l_start - n), l_end):
                 if i + 1 == l_start and i + 1 == l_end:
                     print(
@@ -0,0 +1,121 @@
+"""
+Handling a TeX project, made of a root file and of the files that it includes,
+recursively, using `\\input` and `\\include`.
+"""
+
+from __future__ import annotations  # Support of `|` for type union in Python 3.9
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, TextIO, TypeVar
+
+import multiprocessing
+import re
+import sys
+
+from knowledge_clustering.misc import add_bold, add_orange
+
+T = TypeVar("T")
+
+# Either a comment, which is skipped, or the inclusion of a file, whose name is in
+# the first group if it is given between braces, and in the second group otherwise
+# (as in `\input chapter`). A comment starts with a `%` preceded by an even number
+# of backslashes: `\%` is a percent sign, and `\\%` a line break followed by a comment.
+INCLUDE_REGEX = re.compile(
+    r"(?<!\\)(?:\\\\)*%[^\n]*"
+    r"|\\(?:input|include)\s*\{([^}]*)\}|\\input\s+([^\s{}%\\]+)"
+)
+
+
+def included_files(tex_code: str) -> list[str]:
+    """
+    Returns the names of the files included by some TeX code, as written in the
+    code, in the order in which they are included.
+    """
+    return [
+        (m.group(1) or m.group(2)).strip()
+        for m in INCLUDE_REGEX.finditer(tex_code)
+        if m.group(1) or m.group(2)
+    ]
+
+
+def resolve(name: str, directory: Path) -> Path | None:
+    """
+    Returns the path of an included file, or None if it doesn't exist. As LaTeX
+    does, the extension `.tex` is added to the name if it doesn't have it, and the
+    name is resolved relatively to the directory of the root file.
+    """
+    candidates = [directory / name]
+    if not name.endswith(".tex"):
+        candidates.insert(0, directory / f"{name}.tex")
+    for path in candidates:
+        if path.is_file():
+            return path
+    return None
+
+
+def project_files(root_filename: str, out: TextIO = sys.stdout) -> list[str]:
+    """
+    Returns the root file followed by all the files it includes, recursively, in
+    the order in which they occur in the document; every file occurs once.
+    Outputs a warning for every included file that doesn't exist, such as the files
+    of the TeX distribution.
+    """
+    directory = Path(root_filename).parent
+    filenames: list[str] = []
+    seen: set[Path] = set()
+
+    def visit(path: Path) -> None:
+        if path.resolve() in seen:
+            return
+        seen.add(path.resolve())
+        filenames.append(str(path))
+        with open(path, "r", encoding="utf-8") as f:
+            tex_code = f.read()
+        for name in included_files(tex_code):
+            included = resolve(name, directory)
+            if included is None:
+                print(
+                    add_bold(add_orange("[Warning]"))
+                    + f" file `{name}` included by {path} not found, it is ignored.",
+                    file=out,
+                )
+            else:
+                visit(included)
+
+    visit(Path(root_filename))
+    return filenames
+
+
+def map_files(
+    function: Callable[[str], T],
+    filenames: list[str],
+    jobs: int = 1,
+    initializer: Callable[..., None] | None = None,
+    initargs: tuple[Any, ...] = (),
+) -> list[T]:
+    """
+    Applies a function to every file, using `jobs` processes if jobs > 1, and
+    returns the results in the order of the files. As the processes are spawned,
+    `function`, `initializer` and `initargs` must be picklable.
+    Args:
+        function: a function taking a filename as input.
+        filenames: the names of the files.
+        jobs: the number of processes.
+        initializer: a function called with `initargs` before processing the files,
+            in every process, to set up the state shared by the calls to `function`.
+        initargs: the arguments of `initializer`.
+    """
+    if jobs == 1 or len(filenames) <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return [function(filename) for filename in filenames]
+    # The processes are spawned rather than forked, as forking while another thread
+    # runs (such as the check for updates) may deadlock the child
+    with ProcessPoolExecutor(
+        max_workers=min(jobs, len(filenames)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=initializer,
+        initargs=initargs,
+    ) as pool:
+        return list(pool.map(function, filenames))
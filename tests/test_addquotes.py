@@ -3,9 +3,18 @@ Tests for the modules of knowledge_clustering on which the addquotes command is
 """
 
 from pathlib import Path
+import io
 import shutil
 
+import pytest
+
 from knowledge_clustering.add_quotes import app as app_addquotes
+from knowledge_clustering.add_quotes import apply as apply_addquotes
+from knowledge_clustering.add_quotes import OutdatedQuotes
+from knowledge_clustering.add_quotes import insert_quotes, quote_maximal_substrings
+from knowledge_clustering.aho_corasick import Automaton
+from knowledge_clustering.knowledges import KnowledgesList
+from knowledge_clustering.tex_document import TexDocument
 
 
 def test_app_addquotes() -> None:
@@ -24,3 +33,115 @@ def test_app_addquotes() -> None:
     for filename in ["yes.txt", "ordinal.tex", "ordinal.kl", "output_addquotes.txt"]:
         (p / filename).unlink()
     assert b
+
+
+def test_aho_corasick() -> None:
+    """Tests that the automaton finds all occurrences of all patterns."""
+    patterns = ["word", "ordinal word", "or", "word"]
+    text = "countable ordinal words or word"
+    automaton = Automaton(patterns)
+    expected = [
+        (start, p_id)
+        for p_id, pattern in enumerate(patterns)
+        for start in range(len(text))
+        if text.startswith(pattern, start)
+    ]
+    assert sorted(automaton.find_all(text)) == sorted(expected)
+
+
+def test_dependency_graph() -> None:
+    """Tests the substring relation between knowledges, and their topological sort."""
+    kls = KnowledgesList(["tests/.ordinal.kl.original"])
+    knowledges = kls.get_all_knowledges()
+    assert kls.dependency == {
+        s1: {s2 for s2 in knowledges if s2 in s1 and s1 != s2} for s1 in knowledges
+    }
+    sorted_kl = kls.get_sorted_knowledges()
+    assert sorted(sorted_kl) == sorted(set(knowledges))
+    for s1, deps in kls.dependency.items():
+        for s2 in deps:
+            assert sorted_kl.index(s1) < sorted_kl.index(s2)
+
+
+def test_insert_quotes(tmp_path) -> None:
+    """Tests that quotes are inserted at the right places, even after a paragraph break."""
+    kl_file = tmp_path / "default.kl"
+    kl_file.write_text("\\knowledge{notion}\n | P\n | word\n", encoding="utf-8")
+    tex_doc = TexDocument("A  word % word\nthen\n\n\npar p  word.\n")
+    quotes, new_knowledges = quote_maximal_substrings(
+        tex_doc,
+        KnowledgesList([str(kl_file)]),
+        1,
+        io.StringIO("y\n" * 10),
+        io.StringIO(),
+    )
+    assert new_knowledges == [("P", "par"), ("P", "p")]
+    assert "".join(insert_quotes(tex_doc, quotes)) == (
+        'A  "word" % word\nthen\n\n\n"par" "p"  "word".\n'
+    )
+
+
+def test_addquotes_batch(tmp_path) -> None:
+    """Tests the batch mode of the addquotes command, and applying its output later."""
+    tex, kl = tmp_path / "ordinal.tex", tmp_path / "ordinal.kl"
+    shutil.copy("tests/.ordinal.tex.original", tex)
+    shutil.copy("tests/.ordinal.kl.original", kl)
+    out = io.StringIO()
+    app_addquotes(str(tex), [str(kl)], 1, io.StringIO(), out, policy="all")
+    expected_tex, expected_kl = tex.read_text(), kl.read_text()
+    assert out.getvalue() == "Added 2 pairs of quotes. Defined 1 synonym.\n"
+    shutil.copy("tests/.ordinal.tex.original", tex)
+    shutil.copy("tests/.ordinal.kl.original", kl)
+    json_file = tmp_path / "quotes.json"
+    app_addquotes(
+        str(tex), [str(kl)], 1, io.StringIO(), io.StringIO(), "all", str(json_file)
+    )
+    assert tex.read_text() == Path("tests/.ordinal.tex.original").read_text()
+    diff = io.StringIO()
+    apply_addquotes(str(json_file), str(tex), [str(kl)], diff=True, out=diff)
+    assert '+""words""\n' in diff.getvalue() and "+ | words\n" in diff.getvalue()
+    out = io.StringIO()
+    apply_addquotes(str(json_file), str(tex), [str(kl)], out=out)
+    assert (tex.read_text(), kl.read_text()) == (expected_tex, expected_kl)
+    assert out.getvalue() == "Added 2 pairs of quotes. Defined 1 synonym.\n"
+    with pytest.raises(OutdatedQuotes):
+        apply_addquotes(str(json_file), str(tex), [str(kl)])
+
+
+def test_addquotes_project(tmp_path) -> None:
+    """
+    Tests the addquotes command on a project made of two copies of a file, whose
+    synonyms are defined only once, and applying its output later.
+    """
+    kl, single = tmp_path / "ordinal.kl", tmp_path / "single.tex"
+    shutil.copy("tests/.ordinal.kl.original", kl)
+    shutil.copy("tests/.ordinal.tex.original", single)
+    app_addquotes(str(single), [str(kl)], 1, io.StringIO(), io.StringIO(), "exact")
+    main = tmp_path / "main.tex"
+    main.write_text("\\input{one}\n\\include{two}\n")
+    for name in ["one.tex", "two.tex"]:
+        shutil.copy("tests/.ordinal.tex.original", tmp_path / name)
+    app_addquotes(
+        str(main), [str(kl)], 1, io.StringIO(), io.StringIO(), "exact", project=True
+    )
+    for name in ["one.tex", "two.tex"]:
+        assert (tmp_path / name).read_text() == single.read_text()
+    for name in ["one.tex", "two.tex"]:
+        shutil.copy("tests/.ordinal.tex.original", tmp_path / name)
+    out, json_file = io.StringIO(), tmp_path / "quotes.json"
+    app_addquotes(
+        str(main),
+        [str(kl)],
+        1,
+        io.StringIO(),
+        out,
+        "all",
+        str(json_file),
+        False,
+        True,
+        2,
+    )
+    assert out.getvalue().count("Defined 1 synonym.") == 1
+    apply_addquotes(str(json_file), str(main), [str(kl)])
+    assert "\n | words\n" in kl.read_text()
+    assert '""words""' in (tmp_path / "one.tex").read_text()
@@ -2,10 +2,22 @@
 Tests for the modules of knowledge_clustering on which the anchor command is based.
 """
 
+from io import StringIO
 from pathlib import Path
 import shutil
+import subprocess
+import sys
 
-from knowledge_clustering.add_anchor import app as app_anchor
+from knowledge_clustering.add_anchor import app as app_anchor, missing_anchor
+from knowledge_clustering.tex_document import TexDocument, UNDEFINED
+
+# Modules that the anchor command must not import
+HEAVY_MODULES: list[str] = [
+    "nltk",
+    "requests",
+    "unidecode",
+    "knowledge_clustering.distance",
+]
 
 
 def test_app_anchor() -> None:
@@ -26,3 +38,52 @@ def test_app_anchor() -> None:
     for filename in ["ordinal.tex", "output_anchor.txt"]:
         (p / filename).unlink()
     assert b1 and b2
+
+
+def test_missing_anchor() -> None:
+    """Tests the search of missing anchor points in a TeX document."""
+    tex_doc = TexDocument(
+        '\\AP ""a"" \\intro{b}\n""c""\n\\itemAP \\reintro[d] \\intro{e'
+    )
+    out = StringIO()
+    missing_anchor(tex_doc, 8, out)
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 2
+    assert "line 1" in lines[0] and "b" in lines[0]
+    assert "line 2" in lines[1] and "c" in lines[1]
+    out = StringIO()
+    missing_anchor(tex_doc, 7, out)
+    assert len(out.getvalue().splitlines()) == 3
+
+
+def test_tex_document() -> None:
+    """Tests the cleaning of a TeX document, and the pointers to the original one."""
+    tex_doc = TexDocument("Some  text % comment\nand\n\n\\intro{notion}")
+    assert tex_doc.tex_cleaned == "Some text and \\par \\intro{notion}"
+    i = tex_doc.tex_cleaned.index("\\intro")
+    assert tex_doc.pointer[tex_doc.tex_cleaned.index("and")] == 21
+    assert tex_doc.pointer[i - 1] == UNDEFINED
+    assert tex_doc.find_line(tex_doc.pointer[i]) == 4
+    assert tex_doc.find_col(tex_doc.pointer[i]) == 1
+
+
+def test_anchor_startup(tmp_path) -> None:
+    """
+    Tests that the anchor command doesn't import the dependencies of the other
+    commands, nor the modules using them.
+    """
+    tex = tmp_path / "ordinal.tex"
+    shutil.copy("tests/.ordinal.tex.original", tex)
+    script = f"""
+import sys
+from knowledge_clustering.scripts.app import cli
+try:
+    cli(["anchor", "--no-update", "-t", {str(tex)!r}])
+except SystemExit:
+    pass
+print(sorted(m for m in sys.modules if m in {HEAVY_MODULES!r}))
+"""
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.splitlines()[-1] == "[]"
@@ -0,0 +1,38 @@
+"""
+Tests for the check of updates of knowledge-clustering.
+"""
+
+from pathlib import Path
+import json
+import time
+
+from knowledge_clustering import check_update, _version
+from knowledge_clustering.check_update import UpdateCheck, read_cache
+
+
+def test_update_check_cache(tmp_path: Path, monkeypatch, capsys) -> None:
+    """Tests that PyPI is only contacted when the cached version is stale."""
+    calls: list[int] = []
+
+    def fetch_latest_version() -> str:
+        calls.append(1)
+        return "99.0"
+
+    monkeypatch.setattr(check_update, "fetch_latest_version", fetch_latest_version)
+    cache_path = tmp_path / "latest-version.json"
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump({"time": time.time(), "latest_version": _version.VERSION}, f)
+    update = UpdateCheck(cache_path)
+    update.report()
+    assert update.thread is None and not calls
+    assert "[notice]" not in capsys.readouterr().out
+    # Stale cache
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump({"time": 0, "latest_version": _version.VERSION}, f)
+    update = UpdateCheck(cache_path)
+    assert update.thread is not None
+    update.thread.join()
+    update.report()
+    assert len(calls) == 1
+    assert "99.0" in capsys.readouterr().out
+    assert read_cache(cache_path) == "99.0"
@@ -3,16 +3,39 @@ Tests for the modules of knowledge_clustering on which the cluster command is ba
 """
 
 from typing import TypeVar
+import random
 from pathlib import Path
 import filecmp
 import shutil
 
-from knowledge_clustering.distance import distance, new_stemmer, normalise_notion
+from knowledge_clustering.distance import (
+    FEATURES,
+    LRUCache,
+    cache_stats,
+    cached_stem,
+    clear_caches,
+    set_cache_size,
+    bounded_levenshtein_distance,
+    distance,
+    distance_sets_of_words,
+    levenshtein_distance,
+    minimise_levenshtein_distance,
+    new_stemmer,
+    normalise_notion,
+    notion_features,
+    root_index,
+)
 from knowledge_clustering.scope_meaning import infer_scope, infer_all_scopes
-from knowledge_clustering.clustering import clustering
-from knowledge_clustering.knowledges import Knowledges
+from knowledge_clustering.clustering import clustering, CandidateIndex
+from knowledge_clustering.knowledges import (
+    Knowledges,
+    KnowledgesList,
+    parse_knowledge_file,
+)
 from knowledge_clustering.diagnose import parse as parse_diagnose
+from knowledge_clustering.diagnose import locations, iter_notions, Location
 from knowledge_clustering.config import parse as parse_config
+from knowledge_clustering import nlp_cache, cst, _version
 from knowledge_clustering.clustering import app as app_clustering
 
 T = TypeVar("T")  # Generic type
@@ -22,6 +45,95 @@ def test_normalise() -> None:
     assert (
         normalise_notion("two-way\\\\rational~relation") == "two-way rational relation"
     )
+    assert normalise_notion('$$x$$-\\textsf{B\\"{u}chi}') == "x-buchi"
+    assert normalise_notion("\\\\``z") == "z"
+    assert normalise_notion("a$b") == "a"
+    assert normalise_notion("$x\ny$-word") == "-word"
+
+
+def test_notion_features() -> None:
+    """Tests that the features of a notion are computed once."""
+    features = notion_features("Ordinal semigroups@ORD", "english")
+    assert features is notion_features("Ordinal semigroups@ORD", "english")
+    assert features.normalised == "ordinal semigroups@ord"
+    assert features.scope == "ord"
+    assert set(features.words) == {"ordinal", "semigroups"}
+    assert len(features.stems) == len(features.words)
+
+
+def test_nlp_cache(tmp_path, monkeypatch) -> None:
+    """
+    Tests that the features of notions survive a round-trip through the cache, and
+    that the cache is discarded by another version of knowledge-clustering.
+    """
+    path = tmp_path / "test.cache"
+    notions = ["ordinal semigroups", "word@ord", "$\\omega$-word"]
+    features = [notion_features(kl, "english") for kl in notions]
+    nlp_cache.save(path, notions, "english")
+    nlp_cache.save(path, notions[1:], "english")  # Evicts the first notion
+    for kl in notions:
+        del FEATURES[(kl, "english")]
+    assert nlp_cache.load(path, "english") == 2
+    assert ("ordinal semigroups", "english") not in FEATURES
+    for f in features[1:]:
+        g = notion_features(f.notion, "english")
+        assert (g.normalised, g.scope, g.words, g.stems) == (
+            f.normalised,
+            f.scope,
+            f.words,
+            f.stems,
+        )
+    monkeypatch.setattr(_version, "VERSION", _version.VERSION + ".next")
+    assert nlp_cache.load(path, "english") == 0
+
+
+def test_caches() -> None:
+    """Tests the eviction and statistics of the caches of the distance module."""
+    lru = LRUCache(2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == 1  # "b" is now the least recently used entry
+    lru.put("c", 3)
+    assert "b" not in lru and lru.get("c") == 3
+    assert lru.get("b") is None
+    assert tuple(lru.info()) == (2, 1, 2, 2)
+    set_cache_size(1, "stems")
+    cached_stem("words", "english")
+    cached_stem("words", "english")
+    cached_stem("semigroups", "english")
+    assert tuple(cache_stats()["stems"]) == (1, 2, 1, 1)
+    set_cache_size(cst.CACHE_MAXSIZE, "stems")
+    clear_caches()
+    assert all(info.currsize == 0 for info in cache_stats().values())
+
+
+def test_levenshtein() -> None:
+    """Tests the edit distance against the Wagner–Fischer algorithm."""
+
+    def wagner_fischer(s: str, t: str) -> int:
+        dist = [
+            [i + j if i * j == 0 else 0 for j in range(len(t) + 1)]
+            for i in range(len(s) + 1)
+        ]
+        for i in range(1, len(s) + 1):
+            for j in range(1, len(t) + 1):
+                dist[i][j] = min(
+                    dist[i - 1][j] + 1,
+                    dist[i][j - 1] + 1,
+                    dist[i - 1][j - 1] + (0 if s[i - 1] == t[j - 1] else 1),
+                )
+        return dist[len(s)][len(t)]
+
+    rng = random.Random(0)
+    for _ in range(1000):
+        s = "".join(rng.choice("abé") for _ in range(rng.randint(0, 10)))
+        t = "".join(rng.choice("abé") for _ in range(rng.randint(0, 80)))
+        d = wagner_fischer(s, t)
+        assert levenshtein_distance(s, t) == d
+        bound = rng.randint(0, 5)
+        d_bounded = bounded_levenshtein_distance(s, t, bound)
+        assert d_bounded == d if d <= bound else d_bounded > bound
+    assert minimise_levenshtein_distance("words", ["word", "wordss", "sword"]) == "word"
 
 
 def test_distance() -> None:
@@ -84,6 +196,35 @@ def compare(l1: list[list[T]], l2: list[list[T]]) -> bool:
     return True
 
 
+def test_root_index() -> None:
+    """Tests the canonical forms of words."""
+    roots = root_index(("", "non-"), "english")
+    assert roots.word_roots("non-words") == {
+        "non-words",
+        "non-word",
+        "words",
+        "word",
+    }
+    assert roots.similar("word", "non-words")
+    assert roots.similar("semigroups", "semigroup")
+    assert not roots.similar("word", "sword")
+    assert roots.keys("semigroups") == {"semigroups", "semigroup"}
+
+
+def test_distance_sets_of_words() -> None:
+    """Tests the greedy matching of words, and its early exit."""
+    words1 = ["regular", "languages", "over", "ordinals"]
+    words2 = ["ordinal", "regular", "word"]
+    assert distance_sets_of_words(list(words1), list(words2), ("",), "english") == 3
+    # Matched words are removed from both lists
+    w1, w2 = list(words1), list(words2)
+    distance_sets_of_words(w1, w2, ("",), "english")
+    assert w1 == ["languages", "over"] and w2 == ["word"]
+    for bound in range(5):
+        d = distance_sets_of_words(list(words1), list(words2), ("",), "english", bound)
+        assert d == 3 if bound >= 3 else d > bound
+
+
 def test_scope_meaning() -> None:
     """Tests functions from the module scope_meaning"""
     # Test infer_scope
@@ -111,6 +252,19 @@ def test_scope_meaning() -> None:
     )
 
 
+def test_diagnose() -> None:
+    """Tests the parsing of diagnose files."""
+    assert list(iter_notions("tests/.ordinal.diagnose.original"))[:3] == [
+        "inseparability",
+        "semigroup",
+        "words",
+    ]
+    located = locations("examples/phd/thesis-morvan.diagnose")
+    assert list(located) == parse_diagnose("examples/phd/thesis-morvan.diagnose")
+    assert located["CC BY 4.0"] == [Location("copyright.tex", 36)]
+    assert located["knowledge-clustering"] == [Location("preface.tex", 81)]
+
+
 def test_clustering() -> None:
     """Tests functions from the clustering module."""
     kls = Knowledges("tests/.ordinal.kl.original")
@@ -128,6 +282,96 @@ def test_clustering() -> None:
     assert compare(kls.get_all_bags(), solution)
 
 
+def test_define_synonym_of() -> None:
+    """Tests the addition of knowledges to a list of knowledge files."""
+    kls = KnowledgesList(["tests/.ordinal.kl.original"])
+    kl_struct = kls.default_kls()
+    assert not kl_struct.was_changed()
+    b_id = kls.location("word")[1]
+    kls.add_new_bag("semigroup")
+    kls.define_synonym_of("words", "word")
+    kls.define_synonym_of("semigroups", "semigroup")
+    assert kl_struct.was_changed()
+    assert kls.location("words") == ("tests/.ordinal.kl.original", b_id)
+    assert kls.get_all_bags()[b_id][-1] == "words"
+    assert kls.get_new_bags() == [["semigroup", "semigroups"]]
+    assert kls.get_new_knowledges_in_file("tests/.ordinal.kl.original") == [
+        "words",
+        "semigroup",
+        "semigroups",
+    ]
+    try:
+        kls.define_synonym_of("words", "not a knowledge")
+        assert False
+    except KeyError:
+        pass
+
+
+def test_parse_knowledge_file(tmp_path) -> None:
+    """
+    Tests the parsing of knowledge files, and the reading of multiple files by
+    KnowledgesList.
+    """
+    lines = [
+        "\\knowledgeconfigure{}",
+        "  \\knowledge{notion}",
+        " | word",
+        "% | discarded synonym",
+        "\t|  words ",
+        "text",
+        cst.DISCARD_LINE,
+        "%\\knowledge{notion}",
+        "%  | new",
+        "\\knowledge{url={x}}",
+        "|",
+    ]
+    document, bags = parse_knowledge_file(lines)
+    assert bags == [["word", "words"], [""]]
+    assert [block.lines for block in document] == [
+        ["\\knowledgeconfigure{}"],
+        ["  \\knowledge{notion}", " | word", "\t|  words "],
+        ["text"],
+        ["\\knowledge{url={x}}", "|"],
+    ]
+    filenames = []
+    for i in range(3):
+        filenames.append(str(tmp_path / f"{i}.kl"))
+        Path(filenames[-1]).write_text(f"\\knowledge{{notion}}\n | kl{i}\n")
+    kls = KnowledgesList(filenames)
+    assert kls.get_all_knowledges() == ["kl0", "kl1", "kl2"]
+    assert kls.default_fn == filenames[-1]
+
+
+def test_clustering_jobs() -> None:
+    """Tests that computing distances in parallel does not change the result."""
+    list_prefixes = parse_config("knowledge_clustering/data/english.ini")
+    bags = []
+    for jobs in [1, 2]:
+        kls = Knowledges("tests/.ordinal.kl.original")
+        unknown_kl = parse_diagnose("tests/.ordinal.diagnose.original")
+        scopes_meaning = infer_all_scopes(kls.get_all_bags(), "english")
+        clustering(kls, unknown_kl, 1, list_prefixes, scopes_meaning, "english", jobs)
+        bags.append(kls.get_all_bags())
+    assert bags[0] == bags[1]
+
+
+def test_candidate_index() -> None:
+    """Tests that the candidate index never discards a pair of near knowledges."""
+    kls = Knowledges("tests/.ordinal.kl.original")
+    unknown_kl = parse_diagnose("tests/.ordinal.diagnose.original")
+    prefixes = tuple(parse_config("knowledge_clustering/data/english.ini"))
+    scopes_meaning = infer_all_scopes(kls.get_all_bags(), "english")
+    for alpha in [0, 1, 2]:
+        index = CandidateIndex(alpha, prefixes, scopes_meaning, "english")
+        for kl in kls.get_all_knowledges():
+            index.add(kl)
+        for kl in unknown_kl:
+            candidates = [features.notion for features in index.candidates(kl)]
+            for kl2 in kls.get_all_knowledges():
+                if distance(kl, kl2, prefixes, scopes_meaning, "english") <= alpha:
+                    assert kl2 in candidates
+
+
 def test_app_clustering() -> None:
     """Tests the cluster command."""
     for filename in ["ordinal.kl", "ordinal.diagnose"]:
@@ -144,3 +388,29 @@ def test_app_clustering() -> None:
     p = Path("tests/")
     for filename in ["ordinal.kl", "ordinal.diagnose"]:
         (p / filename).unlink()
+
+
+def test_app_clustering_incremental(capsys) -> None:
+    """Tests the incremental mode of the cluster command."""
+    for filename in ["ordinal.kl", "ordinal.diagnose"]:
+        shutil.copy(f"tests/.{filename}.original", f"tests/{filename}")
+    for run in range(2):
+        # The second run should not add the same knowledges again, nor write the
+        # knowledge file, as nothing changed
+        app_clustering(
+            ["tests/ordinal.kl"],
+            "tests/ordinal.diagnose",
+            False,
+            False,
+            "en",
+            None,
+            cache=True,
+            incremental=True,
+        )
+        assert filecmp.cmp(
+            "tests/ordinal.kl", "tests/.ordinal.kl.solution", shallow=False
+        )
+        assert ("Found a solution" in capsys.readouterr().out) == (run == 0)
+    p = Path("tests/")
+    for filename in ["ordinal.kl", "ordinal.diagnose", cst.NLP_CACHE_FILENAME]:
+        (p / filename).unlink()
@@ -0,0 +1,42 @@
+"""
+Tests for the instrumentation module.
+"""
+
+import io
+
+from knowledge_clustering import instrumentation as instr
+
+
+def test_instrumentation() -> None:
+    """
+    Tests that stages and counters are ignored unless enabled, and that the report
+    prints every stage below the stage enclosing it.
+    """
+    with instr.stage("ignored"):
+        instr.count("ignored")
+    assert not instr.STAGES and not instr.COUNTERS
+    out = io.StringIO()
+    with instr.session(True, None, out):
+        for _ in range(2):
+            with instr.stage("a"):
+                with instr.stage("b"):
+                    instr.count("calls", 3)
+        with instr.stage("b"):
+            pass
+    assert list(instr.STAGES) == [
+        ("total",),
+        ("total", "a"),
+        ("total", "a", "b"),
+        ("total", "b"),
+    ]
+    assert instr.COUNTERS == {"calls": 6}
+    assert not instr.ENABLED
+    lines = out.getvalue().splitlines()
+    assert lines[0] == "Timings:"
+    assert [line.split(":")[0] for line in lines[1:5]] == [
+        "\ttotal",
+        "\t  a",
+        "\t    b",
+        "\t  b",
+    ]
+    assert "\tcalls: 6" in lines
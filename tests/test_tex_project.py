@@ -0,0 +1,59 @@
+"""
+Tests for the tex_project module, and for the project mode of the anchor command.
+"""
+
+import io
+
+from knowledge_clustering.add_anchor import app as app_anchor
+from knowledge_clustering.tex_project import included_files, project_files
+
+
+def test_included_files() -> None:
+    """Tests that included files are found, except in comments."""
+    tex_code = (
+        "\\input{a}\n% \\input{b}\n\\include{ c }\\includegraphics{d}\n"
+        "\\input e.tex\n\\inputencoding{f}"
+    )
+    assert included_files(tex_code) == ["a", "c", "e.tex"]
+    # An escaped percent sign doesn't start a comment, unlike a line break followed
+    # by a percent sign
+    tex_code = "100\\% of it, \\input{a}\nline\\\\% \\input{b}\n\\\\\\%\\input{c}"
+    assert included_files(tex_code) == ["a", "c"]
+
+
+def test_project_files(tmp_path) -> None:
+    """Tests the resolution of the included files, relatively to the root file."""
+    (tmp_path / "chapters").mkdir()
+    (tmp_path / "main.tex").write_text(
+        "\\input{chapters/one}\n\\include{chapters/two}\n\\input{glyphtounicode}\n"
+    )
+    # Files are relative to the root file, and included once
+    (tmp_path / "chapters" / "one.tex").write_text("\\input{chapters/two.tex}")
+    (tmp_path / "chapters" / "two.tex").write_text("\\input{main}")
+    out = io.StringIO()
+    assert project_files(str(tmp_path / "main.tex"), out) == [
+        str(tmp_path / name)
+        for name in ["main.tex", "chapters/one.tex", "chapters/two.tex"]
+    ]
+    assert "glyphtounicode" in out.getvalue()
+
+
+def test_app_anchor_project(tmp_path) -> None:
+    """Tests that the anchor command processes all the files of a project."""
+    tex_code = open("tests/.ordinal.tex.original", encoding="utf-8").read()
+    (tmp_path / "one.tex").write_text(tex_code)
+    (tmp_path / "two.tex").write_text(tex_code)
+    (tmp_path / "main.tex").write_text("\\input{one}\n\\input{two}\n")
+    single = io.StringIO()
+    app_anchor(str(tmp_path / "one.tex"), 5, single)
+    for jobs in [1, 2]:
+        out = io.StringIO()
+        app_anchor(str(tmp_path / "main.tex"), 5, out, project=True, jobs=jobs)
+        expected = [
+            line.replace(" (", f" of {tmp_path / name} (", 1)
+            for name in ["one.tex", "two.tex"]
+            for line in single.getvalue().splitlines()
+        ]
+        # The example includes a file that is missing, hence a warning
+        warnings = out.getvalue().splitlines()
+        assert [line for line in warnings if "[Warning]" not in line] == expected